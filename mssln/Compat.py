@@ -0,0 +1,85 @@
+import sys
+import types
+import warnings
+
+# Python 2 and Python 3 differences used by the tool
+
+PY2 = sys.version_info[0] == 2
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+if PY2:
+    def native_str(value):
+        # XML parsers return unicode text, the rest of the tool uses str
+        if isinstance(value,unicode):
+            return value.encode("utf-8")
+        else:
+            return value
+
+    def open_text(filename):
+        return open(filename,"rt")
+else:
+    def native_str(value):
+        return value
+
+    def open_text(filename):
+        # Visual Studio writes files with UTF-8 BOM
+        return open(filename,"rt",encoding="utf-8-sig")
+
+def convert_python2_source(source,filename):
+    # returns source converted by lib2to3 or None if lib2to3 is not available
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+
+        try:
+            from lib2to3.refactor import RefactoringTool,get_fixers_from_package
+        except ImportError:
+            return None
+
+        tool = RefactoringTool(get_fixers_from_package("lib2to3.fixes"))
+
+        return str(tool.refactor_string(source if source.endswith("\n") else source + "\n",filename))
+
+def load_source(name,filename):
+    # loads module from file (as imp.load_source did), Python 2 module is
+    # converted on the fly when loaded by Python 3
+    if PY2:
+        import imp
+        return imp.load_source(name,filename)
+
+    import importlib.util
+
+    spec   = importlib.util.spec_from_file_location(name,filename)
+    module = importlib.util.module_from_spec(spec)
+
+    try:
+        spec.loader.exec_module(module)
+    except SyntaxError as e:
+        error = e
+
+        with open(filename,"rt") as src:
+            try:
+                source = convert_python2_source(src.read(),filename)
+            except Exception:
+                raise RuntimeError("can't load %s (%s at line %s), it is neither Python 3 nor Python 2 source" % (filename,error.msg,error.lineno))
+
+        if source is None:
+            raise RuntimeError("can't load %s (%s at line %s): Python 2 sources are converted with lib2to3, which is removed in Python 3.13, port it to Python 3 (e.g. 2to3 -w %s with older Python)"
+                               % (filename,error.msg,error.lineno,filename))
+
+        module = types.ModuleType(name)
+        module.__file__ = filename
+
+        try:
+            code = compile(source,filename,"exec")
+        except SyntaxError as e:
+            raise RuntimeError("can't load %s (%s at line %s after conversion from Python 2), port it to Python 3" % (filename,e.msg,e.lineno))
+
+        exec(code,module.__dict__)
+
+    sys.modules[name] = module
+
+    return module
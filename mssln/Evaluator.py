@@ -2,8 +2,15 @@ import re
 
 import os.path
 
+import mssln.Stats as Stats
+from mssln.Log import logger
+
 class Environment:
     def __init__(self,initial_vars=None,initial_meta=None):
+        # results shared by environments evaluating the same text with the same
+        # variables values (configuration lanes of single pass walk), or None
+        self.shared_results = None
+
         if initial_vars is not None:
             self.vars = dict(initial_vars)
         else:
@@ -15,68 +22,119 @@ class Environment:
             self.meta = {}
 
     def set_var(self,name,value):
-        print "setting %s = %s" % (name,value)
+        logger.debug("setting %s = %s",name,value)
         self.vars[name] = value
 
     def get_var(self,name):
-        if self.vars.has_key(name):
+        if name in self.vars:
             return self.vars[name]
         else:
             return self.get_undefined_var(name)
 
     def get_undefined_var(self,name):
-        print "warning: access to undefined variable (%s)" % (name)
+        logger.warning("access to undefined variable (%s)",name)
         return ""
 
     def set_meta_var(self,name,value):
-        print "setting meta %s = %s" % (name,value)
+        logger.debug("setting meta %s = %s",name,value)
         self.meta[name] = value
 
     def get_meta_var(self,name):
-        if self.meta.has_key(name):
+        if name in self.meta:
             return self.meta[name]
         else:
             return self.get_undefined_meta(name)
 
     def get_undefined_meta(self,name):
-        print "warning: access to undefined meta variable (%s)" % (name)
+        logger.warning("access to undefined meta variable (%s)",name)
         return ""
 
-def _eval_subst_vars(expr,env):
-    result      = expr
-    start       = 0
-    start_index = result.find("$(")
+# Expressions are compiled once into small node objects and cached by their text,
+# evaluation of compiled node is linear in the size of the expression and its values
 
-    while start_index >= 0:
-        end_index = result.find(")",start_index + 2)
+_ENDS_WITH_RE          = re.compile(r"\$\(([a-zA-Z]+?)\.EndsWith\(('[^']*?)'\)\)")
+_GET_DIRECTORY_NAME_RE = re.compile(r"\$\(\[System.IO.Path\]::GetDirectoryName\(\$\(([a-zA-Z]+?)\)\)\)")
+_COMPARISON_RE         = re.compile(r"'([^']*?)'=='([^']*)'")
 
-        if end_index >= 0:
-            value = str(env.get_var(result[start_index + 2:end_index]))
+class _SubstitutionTemplate:
+    # text split into literal parts and names of referenced variables:
+    # literals[0] + value(names[0]) + literals[1] + ... + literals[-1]
+    def __init__(self,expr,marker,kind):
+        self.literals = []
+        self.names    = []
 
-            result      = result[:start_index] + value + result[end_index + 1:]
-            start_index = result.find("$(",start_index + len(value))
-        else:
-            raise RunTimeException("unterminated variable reference in '%s'" % (expr))
+        start       = 0
+        start_index = expr.find(marker)
 
-    return result
+        while start_index >= 0:
+            end_index = expr.find(")",start_index + 2)
 
-def _eval_subst_meta_vars(expr,env):
-    result      = expr
-    start       = 0
-    start_index = result.find("%(")
+            if end_index < 0:
+                raise RuntimeError("unterminated %s reference in '%s'" % (kind,expr))
 
-    while start_index >= 0:
-        end_index = result.find(")",start_index + 2)
+            self.literals.append(expr[start:start_index])
+            self.names.append(expr[start_index + 2:end_index])
 
-        if end_index >= 0:
-            value = str(env.get_meta_var(result[start_index + 2:end_index]))
+            start       = end_index + 1
+            start_index = expr.find(marker,start)
 
-            result      = result[:start_index] + value + result[end_index + 1:]
-            start_index = result.find("%(",start_index + len(value))
-        else:
-            raise RunTimeException("unterminated meta variable reference in '%s'" % (expr))
+        self.literals.append(expr[start:])
 
-    return result
+    def substitute(self,getter):
+        if len(self.names) == 0:
+            return self.literals[0]
+
+        literals = self.literals
+        parts    = []
+
+        for index,name in enumerate(self.names):
+            parts.append(literals[index])
+            parts.append(str(getter(name)))
+
+        parts.append(literals[-1])
+
+        return "".join(parts)
+
+    def substitute_values(self,values):
+        # values of names, already read by caller
+        parts = [ self.literals[0] ]
+
+        for index,value in enumerate(values):
+            parts.append(str(value))
+            parts.append(self.literals[index + 1])
+
+        return "".join(parts)
+
+# Compiled expressions depend on expression text only and are shared by all
+# conversions of the process. A cache is dropped when it reaches the limit,
+# so long running processes (watch mode, convert() calls) do not grow.
+CACHE_LIMIT = 100000
+
+def _cache_put(cache,key,value):
+    if len(cache) >= CACHE_LIMIT:
+        cache.clear()
+
+    cache[key] = value
+
+_var_templates  = {}
+_meta_templates = {}
+
+def _get_template(cache,expr,marker,kind):
+    template = cache.get(expr)
+
+    if template is None:
+        template = _SubstitutionTemplate(expr,marker,kind)
+        _cache_put(cache,expr,template)
+
+    return template
+
+def _eval_subst_meta_vars(expr,env):
+    if expr.find("%(") < 0:
+        return expr
+
+    # meta references are looked up after variables substitution, so they are
+    # compiled from the intermediate text (which mostly repeats as well)
+    return _get_template(_meta_templates,expr,"%(","meta variable").substitute(env.get_meta_var)
 
 def _eval_subst_home_envvar(expr):
     parts = expr.split("$HOME")
@@ -86,54 +144,207 @@ def _eval_subst_home_envvar(expr):
     else:
         return expr
 
-def _eval_substitute_vars(expr,env):
-    result = _eval_subst_vars(expr,env)
-    result = _eval_subst_meta_vars(result,env)
-    result = _eval_subst_home_envvar(result)
-    return result
+# Nodes list names of variables they read (in order of reading), so the result
+# of shareable node may be reused by environments with the same values of them.
+# evaluate_values() returns the result and whether it may be shared (it may not
+# if it depends on metadata, which is not a part of the key).
 
-def _eval_special_cases(expr,env):
-    m = re.match("\$\(([a-zA-Z]+?)\.EndsWith\(('[^']*?)'\)\)",expr)
+class _ConstantNode:
+    # expression without variable references: the same for every environment
+    # (configuration lanes of single pass walk), so it is evaluated once
+    names     = ()
+    shareable = True
 
-    if m is not None:
-        varname = m.group(1)
-        suffix  = m.group(2)
+    def __init__(self,value):
+        self.value = value
+
+    def evaluate(self,env):
+        return self.value
+
+    def evaluate_values(self,values,env):
+        return self.value,True
+
+def _is_constant(expr):
+    return expr.find("$(") < 0 and expr.find("%(") < 0
+
+class _SubstituteNode:
+    def __init__(self,expr):
+        self.template  = _get_template(_var_templates,expr,"$(","variable")
+        self.names     = tuple(self.template.names)
+        self.shareable = all(map(lambda x : x.find("%(") < 0,self.template.literals))
+
+    def evaluate(self,env):
+        result = self.template.substitute(env.get_var)
+        result = _eval_subst_meta_vars(result,env)
+        result = _eval_subst_home_envvar(result)
+        return result
+
+    def evaluate_values(self,values,env):
+        result = self.template.substitute_values(values)
+        shared = result.find("%(") < 0
+        result = _eval_subst_meta_vars(result,env)
+        result = _eval_subst_home_envvar(result)
+        return result,shared
+
+class _EndsWithNode:
+    shareable = True
 
-        value = env.get_var(varname)
+    def __init__(self,varname,suffix):
+        self.varname = varname
+        self.suffix  = suffix
+        self.names   = (varname,)
 
-        return value.endswith(suffix)
+    def evaluate(self,env):
+        return env.get_var(self.varname).endswith(self.suffix)
 
-    m = re.match("\$\(\[System.IO.Path\]::GetDirectoryName\(\$\(([a-zA-Z]+?)\)\)\)",expr)
+    def evaluate_values(self,values,env):
+        return values[0].endswith(self.suffix),True
+
+class _GetDirectoryNameNode:
+    shareable = True
+
+    def __init__(self,varname):
+        self.varname = varname
+        self.names   = (varname,)
+
+    def evaluate(self,env):
+        return os.path.dirname(env.get_var(self.varname))
+
+    def evaluate_values(self,values,env):
+        return os.path.dirname(values[0]),True
+
+class _ComparisonNode:
+    def __init__(self,left,right):
+        self.left      = left
+        self.right     = right
+        self.names     = left.names + right.names
+        self.shareable = left.shareable and right.shareable
+
+    def evaluate(self,env):
+        return self.left.evaluate(env) == self.right.evaluate(env)
+
+    def evaluate_values(self,values,env):
+        count     = len(self.left.names)
+        left,lok  = self.left.evaluate_values(values[:count],env)
+        right,rok = self.right.evaluate_values(values[count:],env)
+
+        return left == right,lok and rok
+
+def _compile_special_cases(expr):
+    m = _ENDS_WITH_RE.match(expr)
 
     if m is not None:
-        varname = m.group(1)
+        return _EndsWithNode(m.group(1),m.group(2))
 
-        value = env.get_var(varname)
+    m = _GET_DIRECTORY_NAME_RE.match(expr)
 
-        return os.path.dirname(value)
+    if m is not None:
+        return _GetDirectoryNameNode(m.group(1))
+    elif _is_constant(expr):
+        return _ConstantNode(_eval_subst_home_envvar(expr))
     else:
-        return _eval_substitute_vars(expr,env)
+        return _SubstituteNode(expr)
 
-def _eval_primary(expr,env):
-    return _eval_special_cases(expr,env)
+def _compile_primary(expr):
+    return _compile_special_cases(expr)
 
-def _eval_comparison(expr,env):
-    m = re.match("'([^']*?)'=='([^']*)'",expr)
+def _compile_comparison(expr):
+    m = _COMPARISON_RE.match(expr)
 
     if m is not None:
-        left  = _eval_expr(m.group(1),env)
-        right = _eval_expr(m.group(2),env)
+        left  = _compile_expr(m.group(1))
+        right = _compile_expr(m.group(2))
+
+        if isinstance(left,_ConstantNode) and isinstance(right,_ConstantNode):
+            return _ConstantNode(left.value == right.value)
 
-        return left == right
+        return _ComparisonNode(left,right)
     else:
-       return _eval_primary(expr,env)
+        return _compile_primary(expr)
+
+_compiled_expressions   = {}
+_compiled_substitutions = {} # substitute_vars() does not handle comparisons and functions
+
+def _compile_expr(expr):
+    node = _compiled_expressions.get(expr)
+
+    if node is None:
+        node = _compile_comparison(expr)
+        _cache_put(_compiled_expressions,expr,node)
+
+    return node
+
+def _compile_substitution(value):
+    node = _compiled_substitutions.get(value)
+
+    if node is None:
+        node = _ConstantNode(_eval_subst_home_envvar(value)) if _is_constant(value) else _SubstituteNode(value)
+        _cache_put(_compiled_substitutions,value,node)
+
+    return node
+
+_MISSING = object()
+
+def _evaluate_shared(node,env,shared_results,stats):
+    # evaluated by the first environment, the others reading the same values reuse the result
+    values = [ env.get_var(name) for name in node.names ]
+    key    = (node,tuple(values))
+    result = shared_results.get(key,_MISSING)
+
+    if result is not _MISSING:
+        if stats is not None:
+            stats.count("expressions_shared")
+
+        return result
+
+    if stats is not None:
+        stats.count("expressions_evaluated")
+
+    result,shared = node.evaluate_values(values,env)
+
+    if shared:
+        shared_results[key] = result
+
+    return result
+
+def _evaluate_node(node,env):
+    stats          = Stats.current
+    shared_results = env.shared_results
+
+    if shared_results is not None and node.shareable and not isinstance(node,_ConstantNode):
+        if stats is None:
+            return _evaluate_shared(node,env,shared_results,None)
+
+        stats.begin("evaluate")
+
+        try:
+            return _evaluate_shared(node,env,shared_results,stats)
+        finally:
+            stats.end()
+
+    if stats is None:
+        return node.evaluate(env)
+
+    if isinstance(node,_ConstantNode):
+        stats.count("expressions_constant")
+        return node.value
+
+    stats.begin("evaluate")
+    stats.count("expressions_evaluated")
 
-def _eval_expr(expr,env):
-    return _eval_comparison(expr,env)
+    try:
+        return node.evaluate(env)
+    finally:
+        stats.end()
 
 def evaluate_expression(expr,env):
-    return _eval_expr(expr,env)
+    return _evaluate_node(_compile_expr(expr),env)
 
 def substitute_vars(value,env):
-    return _eval_substitute_vars(value,env)
+    return _evaluate_node(_compile_substitution(value),env)
 
+def clear_expression_cache():
+    _compiled_expressions.clear()
+    _compiled_substitutions.clear()
+    _var_templates.clear()
+    _meta_templates.clear()
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import select
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+# Waits until some of watched files are changed. On Linux inotify (used via
+# ctypes, so no extra modules are required) wakes the watcher up on changes in
+# directories of watched files, on other systems (or if inotify can't be set
+# up) files are polled.
+
+_IN_MODIFY      = 0x00000002
+_IN_ATTRIB      = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM  = 0x00000040
+_IN_MOVED_TO    = 0x00000080
+_IN_CREATE      = 0x00000100
+_IN_DELETE      = 0x00000200
+_IN_CLOEXEC     = 0o2000000
+
+_IN_WATCH_MASK  = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+# editors write files in several steps, changes are checked after events settle
+_SETTLE_TIME = 0.05
+
+def _load_libc():
+    if ctypes is None or not sys.platform.startswith("linux"):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",use_errno=True)
+
+        if not hasattr(libc,"inotify_init1") or not hasattr(libc,"inotify_add_watch"):
+            return None
+
+        return libc
+    except OSError:
+        return None
+
+def _encode_path(path):
+    if isinstance(path,bytes):
+        return path
+    else:
+        return path.encode(sys.getfilesystemencoding() or "utf-8")
+
+class FileWatcher:
+    def __init__(self,filenames,poll_interval=0.25):
+        self.dirs          = []
+        self.poll_interval = poll_interval
+
+        for filename in filenames:
+            if os.path.isdir(filename):
+                dirname = filename
+            else:
+                dirname = os.path.dirname(os.path.abspath(filename))
+
+            if dirname not in self.dirs:
+                self.dirs.append(dirname)
+
+    def wait(self,is_changed):
+        # returns when is_changed() (called on every wake up) returns True
+        libc = _load_libc()
+        fd   = libc.inotify_init1(_IN_CLOEXEC) if libc is not None else -1
+
+        if fd < 0:
+            self.__wait_polling(is_changed)
+            return
+
+        try:
+            for dirname in self.dirs:
+                # missing directories are noticed by periodical check below
+                libc.inotify_add_watch(fd,_encode_path(dirname),_IN_WATCH_MASK)
+
+            self.__wait_inotify(fd,is_changed)
+        finally:
+            os.close(fd)
+
+    def __wait_polling(self,is_changed):
+        while not is_changed():
+            time.sleep(self.poll_interval)
+
+    def __wait_inotify(self,fd,is_changed):
+        while True:
+            ready = select.select([fd],[],[],1.0)[0]
+
+            if len(ready) > 0:
+                os.read(fd,65536)
+
+                time.sleep(_SETTLE_TIME)
+
+                while len(select.select([fd],[],[],0)[0]) > 0:
+                    os.read(fd,65536)
+
+            if is_changed():
+                return
@@ -0,0 +1,124 @@
+import sys
+import logging
+import threading
+
+# Messages of the tool go through "sln2cmake" logger. Arguments are formatted
+# only if message is going to be written, so debug messages on hot paths
+# (every variable set, every imported file) cost a level check only.
+# Warnings are written once, repetitions are counted and reported by
+# log_repeated_warnings(). Counts are kept per thread, so conversions running
+# in different threads do not suppress warnings of each other.
+
+VERBOSE = 15
+
+logging.addLevelName(VERBOSE,"VERBOSE")
+
+_PREFIXES = { logging.INFO    : "note: ",
+              logging.WARNING : "warning: ",
+              logging.ERROR   : "error: " }
+
+class MessageFormatter(logging.Formatter):
+    def format(self,record):
+        message = _PREFIXES.get(record.levelno,"") + record.getMessage()
+
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+
+        return message
+
+class RepeatedWarningsFilter(logging.Filter):
+    def __init__(self):
+        logging.Filter.__init__(self)
+
+        self.local = threading.local()
+
+    def get_counts(self):
+        # (msg,args) -> number of occurrences
+        counts = getattr(self.local,"counts",None)
+
+        if counts is None:
+            counts = self.local.counts = {}
+
+        return counts
+
+    def set_counts(self,counts):
+        self.local.counts = counts
+
+    def filter(self,record):
+        if record.levelno != logging.WARNING or getattr(record,"summary",False):
+            return True
+
+        counts = self.get_counts()
+        key    = (record.msg,record.args)
+        count  = counts.get(key,0)
+
+        counts[key] = count + 1
+
+        return count == 0
+
+logger = logging.getLogger("sln2cmake")
+
+logger.addHandler(logging.NullHandler())
+
+_repeated = RepeatedWarningsFilter()
+
+logger.addFilter(_repeated)
+
+def get_level(verbosity):
+    if verbosity < 0:
+        return logging.WARNING
+    elif verbosity == 0:
+        return logging.INFO
+    elif verbosity == 1:
+        return VERBOSE
+    else:
+        return logging.DEBUG
+
+_verbosity = None # given to setup(), None if logging is not set up by the tool
+
+def setup(verbosity=0,stream=None):
+    # -q is verbosity -1, -v is 1, -vv is 2
+    global _verbosity
+
+    _verbosity = verbosity
+
+    handler = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    handler.setFormatter(MessageFormatter())
+
+    logger.handlers = [ handler ]
+    logger.propagate = False
+    logger.setLevel(get_level(verbosity))
+
+def get_verbosity():
+    return _verbosity
+
+def take_repeated_warnings():
+    counts = _repeated.get_counts()
+
+    _repeated.set_counts({})
+
+    return counts
+
+def restore_repeated_warnings(counts):
+    # continues counting from take_repeated_warnings() result
+    _repeated.set_counts(counts)
+
+def get_repeated_warnings():
+    return dict(_repeated.get_counts())
+
+def get_repeated_warnings_since(previous):
+    # counts of warnings logged after get_repeated_warnings() call
+    return dict([ (key,count - previous.get(key,0)) for key,count in _repeated.get_counts().items() if count != previous.get(key,0) ])
+
+def merge_repeated_warnings(counts):
+    # merges get_repeated_warnings_since() result of other (worker) process
+    current = _repeated.get_counts()
+
+    for key,count in counts.items():
+        current[key] = current.get(key,0) + count
+
+def log_repeated_warnings():
+    repeated = [ (count,msg % args if args else msg) for (msg,args),count in take_repeated_warnings().items() if count > 1 ]
+
+    for count,message in sorted(repeated,key=lambda x : (-x[0],x[1])):
+        logger.warning("%s (repeated %d times)",message,count,extra={ "summary" : True })
@@ -1,7 +1,60 @@
 import collections
+import os
 import xml.dom
 import xml.dom.minidom
 
+import mssln.Stats as Stats
+from mssln.Compat import native_str
+
+# process-wide cache of parsed documents: absolute filename -> (mtime,size,document).
+# Imported files are shared by projects and stay cached, project document is
+# needed only while its configurations are walked and is released after that
+# (see release_document()), so memory does not grow with the solution size.
+# Cache is dropped when it reaches the limit (imports of many solutions
+# converted by long running process).
+DOCUMENT_CACHE_LIMIT = 1000
+
+_document_cache = {}
+
+# returns parsed document, the tree is reused while file's mtime and size are unchanged
+def load_document(filename):
+    path = os.path.abspath(filename)
+    st   = os.stat(path)
+    key  = (st.st_mtime,st.st_size)
+
+    entry = _document_cache.get(path)
+    stats = Stats.current
+
+    if entry is not None and entry[0] == key:
+        if stats is not None:
+            stats.count("document_cache_hits")
+
+        return entry[1]
+
+    if stats is not None:
+        stats.begin("xml_parse")
+        stats.count("documents_parsed")
+
+        try:
+            doc = xml.dom.minidom.parse(path)
+        finally:
+            stats.end()
+    else:
+        doc = xml.dom.minidom.parse(path)
+
+    if len(_document_cache) >= DOCUMENT_CACHE_LIMIT:
+        _document_cache.clear()
+
+    _document_cache[path] = (key,doc)
+
+    return doc
+
+def release_document(filename):
+    _document_cache.pop(os.path.abspath(filename),None)
+
+def clear_document_cache():
+    _document_cache.clear()
+
 def _enumerate_child_elements(node):
     for child in node.childNodes:
         if child.nodeType == xml.dom.Node.ELEMENT_NODE:
@@ -16,11 +69,11 @@ def _str_to_bool(value):
         raise RuntimeError("invalid boolean value (%s)" % (value))
 
 def _get_element_attr(element,attrname):
-    return element.getAttribute(attrname).encode()
+    return native_str(element.getAttribute(attrname))
 
 def _get_element_attr_opt(element,attrname,defval=None):
     if element.hasAttribute(attrname):
-        return element.getAttribute(attrname).encode()
+        return native_str(element.getAttribute(attrname))
     else:
         return defval
 
@@ -31,7 +84,7 @@ def _get_element_text(node):
         if n.nodeType == xml.dom.Node.TEXT_NODE:
             value += n.data
 
-    return value.encode()
+    return native_str(value)
 
 def _node_has_children(node):
     return node.firstChild is not None
@@ -67,12 +120,18 @@ class ProjectVisitor:
     def process_clcompile_optimization_element(self,value,condition):
         pass
 
+    def process_clcompile_precompiled_header(self,value,condition):
+        pass
+
     def on_unknown_clcompile_element(self,name):
         pass
 
     def end_clcompile_item(self):
         pass
 
+    def process_project_reference(self,include,condition,items):
+        pass
+
     def on_unknown_item(self,name):
         pass
 
@@ -121,9 +180,209 @@ class ProjectVisitor:
     def on_unknown_element(self,name):
         pass
 
+class MultiplexProjectVisitor(ProjectVisitor):
+    # Fans every callback out to several visitors (lanes), so one walk of the
+    # project feeds all of them. Each lane still decides on conditional groups
+    # and imports on its own: lanes which rejected a group (or did not resolve
+    # an imported file) are inactive until the walker leaves it.
+
+    def __init__(self,visitors):
+        self.visitors = list(visitors)
+        self.active   = self.visitors
+        self.stack    = []
+        self.imports  = []
+
+    def __push(self,active):
+        self.stack.append(self.active)
+        self.active = active
+
+    def __pop(self):
+        lanes       = self.active
+        self.active = self.stack.pop()
+        return lanes
+
+    def begin_project(self,name,filename):
+        for visitor in self.active:
+            visitor.begin_project(name,filename)
+
+        return True
+
+    def end_project(self):
+        for visitor in self.active:
+            visitor.end_project()
+
+    def begin_subproject(self,name,filename):
+        active = [visitor for visitor,filenames in self.imports[-1] if filename in filenames]
+        active = [visitor for visitor in active if visitor.begin_subproject(name,filename)]
+
+        if len(active) == 0:
+            return False
+
+        self.__push(active)
+
+        return True
+
+    def end_subproject(self):
+        for visitor in self.__pop():
+            visitor.end_subproject()
+
+    def begin_item_group(self,label,condition):
+        active = [visitor for visitor in self.active if visitor.begin_item_group(label,condition)]
+
+        # end_item_group is called by walker for rejected group as well
+        self.__push(active)
+
+        return len(active) > 0
+
+    def process_clinclude_item(self,include):
+        for visitor in self.active:
+            visitor.process_clinclude_item(include)
+
+    def begin_clcompile_item(self,include):
+        active = [visitor for visitor in self.active if visitor.begin_clcompile_item(include)]
+
+        if len(active) == 0:
+            return False
+
+        self.__push(active)
+
+        return True
+
+    def process_clcompile_excluded_from_build(self,value,condition):
+        for visitor in self.active:
+            visitor.process_clcompile_excluded_from_build(value,condition)
+
+    def process_clcompile_additional_options(self,options,condition):
+        for visitor in self.active:
+            visitor.process_clcompile_additional_options(options,condition)
+
+    def process_clcompile_optimization_element(self,value,condition):
+        for visitor in self.active:
+            visitor.process_clcompile_optimization_element(value,condition)
+
+    def process_clcompile_precompiled_header(self,value,condition):
+        for visitor in self.active:
+            visitor.process_clcompile_precompiled_header(value,condition)
+
+    def on_unknown_clcompile_element(self,name):
+        for visitor in self.active:
+            visitor.on_unknown_clcompile_element(name)
+
+    def end_clcompile_item(self):
+        for visitor in self.__pop():
+            visitor.end_clcompile_item()
+
+    def process_project_reference(self,include,condition,items):
+        for visitor in self.active:
+            visitor.process_project_reference(include,condition,items)
+
+    def on_unknown_item(self,name):
+        for visitor in self.active:
+            visitor.on_unknown_item(name)
+
+    def end_item_group(self):
+        self.__pop()
+
+        for visitor in self.active:
+            visitor.end_item_group()
+
+    def begin_item_definition_group(self,label,condition):
+        active = [visitor for visitor in self.active if visitor.begin_item_definition_group(label,condition)]
+
+        # end_item_definition_group is called by walker for rejected group as well
+        self.__push(active)
+
+        return len(active) > 0
+
+    def process_clcompile_definition(self,items):
+        for visitor in self.active:
+            visitor.process_clcompile_definition(items)
+
+    def process_link_definition(self,items):
+        for visitor in self.active:
+            visitor.process_link_definition(items)
+
+    def on_unknown_item_definition(self,name):
+        for visitor in self.active:
+            visitor.on_unknown_item_definition(name)
+
+    def end_item_definition_group(self):
+        self.__pop()
+
+        for visitor in self.active:
+            visitor.end_item_definition_group()
+
+    def begin_property_group(self,label,condition):
+        active = [visitor for visitor in self.active if visitor.begin_property_group(label,condition)]
+
+        if len(active) == 0:
+            return False
+
+        self.__push(active)
+
+        return True
+
+    def end_property_group(self):
+        for visitor in self.__pop():
+            visitor.end_property_group()
+
+    def begin_import(self,project,condition):
+        lanes  = []
+        result = []
+
+        for visitor in self.active:
+            filenames = visitor.begin_import(project,condition)
+
+            if filenames is not None:
+                if type(filenames) is not list and type(filenames) is not tuple:
+                    filenames = [ filenames ]
+
+                lanes.append((visitor,filenames))
+
+                for filename in filenames:
+                    if filename not in result:
+                        result.append(filename)
+
+        if len(lanes) == 0:
+            return None
+
+        self.imports.append(lanes)
+
+        return result
+
+    def end_import(self):
+        for visitor,filenames in self.imports.pop():
+            visitor.end_import()
+
+    def begin_import_group(self,label,condition):
+        active = [visitor for visitor in self.active if visitor.begin_import_group(label,condition)]
+
+        if len(active) == 0:
+            return False
+
+        self.__push(active)
+
+        return True
+
+    def end_import_group(self):
+        for visitor in self.__pop():
+            visitor.end_import_group()
+
+    def process_property(self,name,value):
+        for visitor in self.active:
+            visitor.process_property(name,value)
+
+    def process_project_configuration(self):
+        for visitor in self.active:
+            visitor.process_project_configuration()
+
+    def on_unknown_element(self,name):
+        for visitor in self.active:
+            visitor.on_unknown_element(name)
+
 class ProjectWalker:
     def __init__(self,name,filename):
-        doc = xml.dom.minidom.parse(filename)
+        doc = load_document(filename)
 
         self.name     = name
         self.filename = filename
@@ -143,7 +402,11 @@ class ProjectWalker:
             visitor.end_subproject()
 
     def __walk_project(self,visitor):
-        for child in _enumerate_child_elements(self.root):
+        self.walk_elements(visitor)
+
+    def walk_elements(self,visitor,start=0,stop=None):
+        # walks top-level elements [start,stop) without begin/end_project calls
+        for child in list(_enumerate_child_elements(self.root))[start:stop]:
             name = child.tagName
 
             if   name == "ItemGroup":
@@ -159,6 +422,24 @@ class ProjectWalker:
             else:
                 visitor.on_unknown_element(name)
 
+    def get_import_prefix(self):
+        # leading Import/ImportGroup elements (configurations declaration
+        # preceding them does not affect loading)
+        prefix = []
+
+        for child in _enumerate_child_elements(self.root):
+            if child.tagName in ("Import","ImportGroup"):
+                prefix.append(child)
+            elif child.tagName == "ItemGroup" and child.getAttribute("Label") == "ProjectConfigurations":
+                prefix.append(child)
+            else:
+                break
+
+        while len(prefix) > 0 and prefix[-1].tagName == "ItemGroup":
+            prefix.pop()
+
+        return prefix
+
     def __walk_item_group(self,group_element,visitor):
         if visitor.begin_item_group(_get_element_attr_opt(group_element,"Label"),
                                     _get_element_attr_opt(group_element,"Condition")):
@@ -171,6 +452,8 @@ class ProjectWalker:
                     self.__walk_clinclude_item(child,visitor)
                 elif name == "ClCompile":
                     self.__walk_clcompile_item(child,visitor)
+                elif name == "ProjectReference":
+                    self.__walk_project_reference(child,visitor)
                 else:
                     visitor.on_unknown_item(name)
 
@@ -183,13 +466,13 @@ class ProjectWalker:
             if name == "ExcludedFromBuild":
                 pass
             else:
-                raise RuntimeError,"ClInclude element's contains unsupported subelement (%s)" % (name)
+                raise RuntimeError("ClInclude element's contains unsupported subelement (%s)" % (name))
 
         visitor.process_clinclude_item(_get_element_attr(clinclude_element,"Include"))
 
     def __walk_clcompile_item(self,clcompile_element,visitor):
         if clcompile_element.hasAttribute("Condition"):
-            raise RuntimeError,"unsupported Condition attribute in ClCompile element"
+            raise RuntimeError("unsupported Condition attribute in ClCompile element")
 
         if visitor.begin_clcompile_item(_get_element_attr(clcompile_element,"Include")):
             for child in _enumerate_child_elements(clcompile_element):
@@ -206,11 +489,23 @@ class ProjectWalker:
                     visitor.process_clcompile_additional_options(_get_element_text(child),_get_element_attr(child,"Condition"))
                 elif name == "Optimization":
                     visitor.process_clcompile_optimization_element(_get_element_text(child),_get_element_attr(child,"Condition"))
+                elif name == "PrecompiledHeader":
+                    visitor.process_clcompile_precompiled_header(_get_element_text(child),_get_element_attr_opt(child,"Condition"))
                 else:
                     visitor.on_unknown_clcompile_element(name)
 
             visitor.end_clcompile_item()
 
+    def __walk_project_reference(self,reference_element,visitor):
+        items = []
+
+        for child in _enumerate_child_elements(reference_element):
+            items.append((child.tagName,_get_element_text(child)))
+
+        visitor.process_project_reference(_get_element_attr(reference_element,"Include"),
+                                          _get_element_attr_opt(reference_element,"Condition"),
+                                          items)
+
     def __walk_item_definition_group(self,group_element,visitor):
         if visitor.begin_item_definition_group(_get_element_attr_opt(group_element,"Label"),
                                                _get_element_attr_opt(group_element,"Condition")):
@@ -228,7 +523,7 @@ class ProjectWalker:
 
     def __walk_clcompile_definition(self,clcompile_element,visitor):
         if (clcompile_element.attributes is not None) and (len(clcompile_element.attributes) > 0):
-            raise RuntimeError,"unexpected attribute in ClCompile definition"
+            raise RuntimeError("unexpected attribute in ClCompile definition")
 
         items = []
 
@@ -239,7 +534,7 @@ class ProjectWalker:
 
     def __walk_link_definition(self,link_element,visitor):
         if (link_element.attributes is not None) and (len(link_element.attributes) > 0):
-            raise RuntimeError,"unexpected attribute in Link definition"
+            raise RuntimeError("unexpected attribute in Link definition")
 
         items = []
 
@@ -266,7 +561,7 @@ class ProjectWalker:
                 if child.tagName == "Import":
                     self.__walk_import(child,visitor)
                 else:
-                    raise RuntimeError,"invalid element (%s) in <ImportGroup>" % (child.tagName)
+                    raise RuntimeError("invalid element (%s) in <ImportGroup>" % (child.tagName))
 
             visitor.end_import_group()
 
@@ -1,16 +1,26 @@
 import re
 
+from mssln.Compat import open_text
+
 _SLN_HEADER_STRING = "Microsoft Visual Studio Solution File, Format Version 12.00"
 _UNICODE_BOM = "\xef\xbb\xbf"
 
+_GLOBAL_SECTION_RE        = re.compile(r"GlobalSection\((.+?)\)\s*=\s*\S+")
+_PROJECT_CONFIGURATION_RE = re.compile(r"{(.+?)}\.(.+?)\.(ActiveCfg|Build\.0|Deploy\.0)\s*=\s*(.+)")
+
 class _TextFile:
     def __init__(self,src):
         self.__src  = src
         self.__line = 0
 
     def readline(self):
+        line = self.__src.readline()
+
+        if len(line) == 0:
+            return None # end of file
+
         self.__line += 1
-        return self.__src.readline()
+        return line
 
     def get_line_number(self):
         return self.__line
@@ -18,11 +28,13 @@ class _TextFile:
     def get_filename(self):
         return self.__src.name
 
-class SlnException:
+class SlnException(Exception):
     pass
 
 class SlnParseException(SlnException) :
     def __init__(self,message,src):
+        SlnException.__init__(self,message)
+
         self.message  = message
         self.filename = src.get_filename()
         self.line     = src.get_line_number();
@@ -34,6 +46,29 @@ class ProjectInfo:
         self.filename = filename
         self.prj_uuid = prj_uuid
 
+        # solution "configuration|platform" -> project (configuration,platform)
+        self.active_configurations = {}
+        # solution "configuration|platform" names the project is built in
+        self.build_configurations  = set()
+
+    def has_configurations(self):
+        return len(self.active_configurations) > 0
+
+    def get_build_configurations(self,solution_configurations):
+        # project (configuration,platform) pairs built by solution configurations, in solution order
+        result = []
+
+        for configuration,platform in solution_configurations:
+            name = configuration + "|" + platform
+
+            if name in self.build_configurations and name in self.active_configurations:
+                prj_configuration = self.active_configurations[name]
+
+                if prj_configuration not in result:
+                    result.append(prj_configuration)
+
+        return result
+
 class Solution:
     def __init__(self,filename=None):
         self.__buffered_line = None
@@ -44,19 +79,20 @@ class Solution:
             self.load(filename)
 
     def clear(self):
-        self.vars     = {}
-        self.projects = []
+        self.vars           = {}
+        self.projects       = []
+        self.configurations = [] # (configuration,platform) from SolutionConfigurationPlatforms
 
     def load(self,filename):
         self.clear()
 
-        with open(filename,"rt") as src:
+        with open_text(filename) as src:
             lsrc = _TextFile(src)
 
             self.__parse_header(lsrc)
             self.__parse_vars(lsrc)
             self.__parse_projects(lsrc)
-#            self.__parse_global(lsrc)
+            self.__parse_global(lsrc)
 
             src.close();
 
@@ -104,7 +140,7 @@ class Solution:
             self.__unreadline(line)
 
     def __parse_project_def(self,src,line):
-        def_re = 'Project\("{(.+?)}"\)\s*=\s*"(.+?)"\s*,\s*"(.+?)"\s*,\s*"{(.+?)}"'
+        def_re = r'Project\("{(.+?)}"\)\s*=\s*"(.+?)"\s*,\s*"(.+?)"\s*,\s*"{(.+?)}"'
 
         m = re.match(def_re,line)
 
@@ -121,13 +157,93 @@ class Solution:
         done = False
 
         while not done:
-            line = self.__readline(src)
+            line = self.__getline(src)
 
             if line == "EndProject":
                 done = True
 
         return prj
 
+    def __parse_global(self,src):
+        line = self.__readline(src)
+
+        if line is None:
+            return
+
+        if line != "Global":
+            raise SlnParseException("unexpected line (%s), Global section expected" % (line),src)
+
+        projects = {}
+
+        for prj in self.projects:
+            projects[prj.prj_uuid.upper()] = prj
+
+        done = False
+
+        while not done:
+            line = self.__getline(src)
+
+            if line == "EndGlobal":
+                done = True
+            elif line.startswith("GlobalSection("):
+                m = _GLOBAL_SECTION_RE.match(line)
+
+                if m is None:
+                    raise SlnParseException("invalid global section definition (%s)" % (line),src)
+
+                section = m.group(1)
+
+                if section == "SolutionConfigurationPlatforms":
+                    self.__parse_solution_configurations(src)
+                elif section == "ProjectConfigurationPlatforms":
+                    self.__parse_project_configurations(src,projects)
+                else:
+                    self.__skip_global_section(src)
+            else:
+                raise SlnParseException("unexpected line (%s) in Global section" % (line),src)
+
+    def __skip_global_section(self,src):
+        while self.__getline(src) != "EndGlobalSection":
+            pass
+
+    def __parse_solution_configurations(self,src):
+        line = self.__getline(src)
+
+        while line != "EndGlobalSection":
+            name = line.split("=",1)[0].strip()
+            parts = name.split("|",1)
+
+            if len(parts) != 2:
+                raise SlnParseException("invalid solution configuration (%s)" % (line),src)
+
+            self.configurations.append((parts[0],parts[1]))
+
+            line = self.__getline(src)
+
+    def __parse_project_configurations(self,src,projects):
+        line = self.__getline(src)
+
+        while line != "EndGlobalSection":
+            m = _PROJECT_CONFIGURATION_RE.match(line)
+
+            if m is None:
+                raise SlnParseException("invalid project configuration (%s)" % (line),src)
+
+            prj = projects.get(m.group(1).upper())
+
+            if prj is not None:
+                if m.group(3) == "ActiveCfg":
+                    parts = m.group(4).split("|",1)
+
+                    if len(parts) != 2:
+                        raise SlnParseException("invalid project configuration (%s)" % (line),src)
+
+                    prj.active_configurations[m.group(2)] = (parts[0],parts[1])
+                elif m.group(3) == "Build.0":
+                    prj.build_configurations.add(m.group(2))
+
+            line = self.__getline(src)
+
     def __readline(self,src):
         if self.__buffered_line is not None:
             line = self.__buffered_line
@@ -160,7 +276,7 @@ class Solution:
 
     def __unreadline(self,line):
         if self.__buffered_line is not None:
-            raise RuntimeError,"double ungetline is not supported"
+            raise RuntimeError("double ungetline is not supported")
 
         self.__buffered_line = line
 
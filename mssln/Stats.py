@@ -0,0 +1,204 @@
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+if hasattr(time,"process_time"):
+    _cpu_time = time.process_time
+else:
+    _cpu_time = time.clock
+
+def get_process_peak_rss_kb():
+    # high-water mark of the whole process so far, not peak of a phase
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if sys.platform == "darwin":
+        rss = rss // 1024 # bytes on macOS
+
+    return rss
+
+def is_allocation_tracing_supported():
+    # peak is reset between phases, reset_peak() was added in python 3.9
+    return tracemalloc is not None and hasattr(tracemalloc,"reset_peak")
+
+def start_allocation_tracing():
+    if not is_allocation_tracing_supported():
+        raise RuntimeError("tracing of allocations requires python 3.9 or newer")
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    tracemalloc.reset_peak()
+
+def take_allocation_peak_kb():
+    # peak of traced python allocations since previous call
+    peak = tracemalloc.get_traced_memory()[1] // 1024
+    tracemalloc.reset_peak()
+    return peak
+
+def _max_optional(a,b):
+    if a is None:
+        return b
+    elif b is None:
+        return a
+    else:
+        return max(a,b)
+
+# statistics of current run, None if statistics are not collected
+current = None
+
+class RunStats:
+    # Time is accounted to the innermost open phase only (phases nest, e.g.
+    # expressions are evaluated while an import is resolved), so phase times
+    # add up to the run time. Memory is sampled as process peak RSS when phase
+    # ends: it is the maximum reached by the process up to that moment (during
+    # any earlier phase as well), so it tells in which phase the process peak
+    # was reached, not how much memory the phase itself used.
+    #
+    # With trace_allocations python allocations are traced (tracemalloc) and
+    # peak of traced memory is sampled whenever phase or project begins or
+    # ends; the peak is accounted to every phase open in the meantime, so
+    # allocation peak of phase is the maximum reached while the phase was open.
+
+    def __init__(self,trace_allocations=False):
+        self.phases   = {} # name -> [calls,wall,cpu,process_peak_rss_kb,allocation_peak_kb]
+        self.counters = {}
+        self.projects = []
+        self.stack    = []
+        self.project  = None
+
+        self.trace_allocations  = trace_allocations
+        self.allocation_peak_kb = None
+        self.project_peak_kb    = None
+
+        if trace_allocations:
+            start_allocation_tracing()
+
+        self.start_wall = self.last_wall = time.time()
+        self.start_cpu  = self.last_cpu  = _cpu_time()
+
+    def __switch(self):
+        wall = time.time()
+        cpu  = _cpu_time()
+
+        if len(self.stack) > 0:
+            phase = self.phases[self.stack[-1]]
+            phase[1] += wall - self.last_wall
+            phase[2] += cpu - self.last_cpu
+
+        self.last_wall = wall
+        self.last_cpu  = cpu
+
+        if self.trace_allocations:
+            peak = take_allocation_peak_kb()
+
+            for name in set(self.stack):
+                phase    = self.phases[name]
+                phase[4] = _max_optional(phase[4],peak)
+
+            self.allocation_peak_kb = _max_optional(self.allocation_peak_kb,peak)
+
+            if self.project is not None:
+                self.project_peak_kb = _max_optional(self.project_peak_kb,peak)
+
+    def begin(self,name):
+        self.__switch()
+
+        phase = self.phases.get(name)
+
+        if phase is None:
+            phase = [0,0.0,0.0,None,None]
+            self.phases[name] = phase
+
+        phase[0] += 1
+
+        self.stack.append(name)
+
+    def end(self):
+        self.__switch()
+
+        phase = self.phases[self.stack.pop()]
+        phase[3] = _max_optional(phase[3],get_process_peak_rss_kb())
+
+    def count(self,name,value=1):
+        self.counters[name] = self.counters.get(name,0) + value
+
+    def begin_project(self,name,action):
+        self.__switch()
+
+        self.project         = (name,action,time.time(),_cpu_time(),dict(self.counters))
+        self.project_peak_kb = None
+
+    def end_project(self):
+        self.__switch()
+
+        name,action,wall,cpu,counters = self.project
+
+        deltas = {}
+
+        for counter,value in self.counters.items():
+            if value != counters.get(counter,0):
+                deltas[counter] = value - counters.get(counter,0)
+
+        self.projects.append({ "project"             : name,
+                               "action"              : action,
+                               "wall_seconds"        : time.time() - wall,
+                               "cpu_seconds"         : _cpu_time() - cpu,
+                               "process_peak_rss_kb" : get_process_peak_rss_kb(),
+                               "allocation_peak_kb"  : self.project_peak_kb,
+                               "counters"            : deltas })
+
+        self.project = None
+
+    def merge(self,data):
+        # merges to_dict() result of other (worker process) statistics
+        for name,value in data["phases"].items():
+            phase = self.phases.get(name)
+
+            if phase is None:
+                phase = [0,0.0,0.0,None,None]
+                self.phases[name] = phase
+
+            phase[0] += value["calls"]
+            phase[1] += value["wall_seconds"]
+            phase[2] += value["cpu_seconds"]
+            phase[3]  = _max_optional(phase[3],value["process_peak_rss_kb"])
+            phase[4]  = _max_optional(phase[4],value["allocation_peak_kb"])
+
+        for name,value in data["counters"].items():
+            self.count(name,value)
+
+        self.projects.extend(data["projects"])
+
+        self.allocation_peak_kb = _max_optional(self.allocation_peak_kb,data["total"]["allocation_peak_kb"])
+
+    def to_dict(self):
+        self.__switch()
+
+        phases = {}
+
+        for name,phase in self.phases.items():
+            phases[name] = { "calls"               : phase[0],
+                             "wall_seconds"        : phase[1],
+                             "cpu_seconds"         : phase[2],
+                             "process_peak_rss_kb" : phase[3],
+                             "allocation_peak_kb"  : phase[4] }
+
+        return { "total"    : { "wall_seconds"        : time.time() - self.start_wall,
+                                "cpu_seconds"         : _cpu_time() - self.start_cpu,
+                                "process_peak_rss_kb" : get_process_peak_rss_kb(),
+                                "allocation_peak_kb"  : self.allocation_peak_kb },
+                 "phases"   : phases,
+                 "counters" : dict(self.counters),
+                 "projects" : list(self.projects) }
@@ -0,0 +1,272 @@
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+import mssln.Stats as Stats
+from mssln.Compat import native_str
+
+# Drives ProjectVisitor callbacks (see ProjectWalker) from iterparse events.
+# Top-level groups are dispatched child by child and every element is
+# detached from the tree as soon as it was visited, so memory usage does
+# not depend on number of items in the project file.
+
+def _local_name(tag):
+    index = tag.rfind("}")
+
+    if index >= 0:
+        return tag[index + 1:]
+    else:
+        return tag
+
+def _enumerate_child_elements(element):
+    # comments and processing instructions are not reported by iterparse
+    return iter(element)
+
+def _str_to_bool(value):
+    if value == "true":
+        return True
+    elif value == "false":
+        return False
+    else:
+        raise RuntimeError("invalid boolean value (%s)" % (value))
+
+def _get_element_attr(element,attrname):
+    return native_str(element.get(attrname,""))
+
+def _get_element_attr_opt(element,attrname,defval=None):
+    value = element.get(attrname)
+
+    if value is not None:
+        return native_str(value)
+    else:
+        return defval
+
+def _get_element_text(element):
+    value = element.text or ""
+
+    for child in element:
+        if child.tail:
+            value += child.tail
+
+    return native_str(value)
+
+class StreamingProjectWalker:
+    def __init__(self,name,filename):
+        self.name     = name
+        self.filename = filename
+
+    def walk(self,visitor):
+        visitor.begin_project(self.name,self.filename)
+
+        self.__walk_project(visitor)
+
+        visitor.end_project()
+
+    def __walk_subproject(self,visitor):
+        if visitor.begin_subproject(self.name,self.filename):
+            self.__walk_project(visitor)
+
+            visitor.end_subproject()
+
+    def __walk_project(self,visitor):
+        stats = Stats.current
+
+        if stats is None:
+            self.__walk_events(visitor)
+            return
+
+        # parsing is interleaved with visiting here, so xml_parse phase
+        # includes walking (visitor's own phases are accounted separately)
+        stats.begin("xml_parse")
+        stats.count("documents_parsed")
+
+        try:
+            self.__walk_events(visitor)
+        finally:
+            stats.end()
+
+    def __walk_events(self,visitor):
+        stack = []
+        group = None # [name,accepted] of currently opened top-level group
+
+        for event,element in ElementTree.iterparse(self.filename,events=("start","end")):
+            if event == "start":
+                stack.append(element)
+
+                if len(stack) == 2:
+                    group = self.__begin_group(element,visitor)
+
+                continue
+
+            stack.pop()
+
+            depth = len(stack)
+
+            if depth == 2:
+                if group is not None and group[1]:
+                    self.__walk_group_child(group[0],element,visitor)
+
+                stack[-1].remove(element)
+            elif depth == 1:
+                if group is not None:
+                    self.__end_group(group,visitor)
+                else:
+                    self.__walk_top_element(element,visitor)
+
+                group = None
+
+                stack[-1].remove(element)
+
+    def __begin_group(self,element,visitor):
+        name      = _local_name(element.tag)
+        label     = _get_element_attr_opt(element,"Label")
+        condition = _get_element_attr_opt(element,"Condition")
+
+        if   name == "ItemGroup":
+            return [name,visitor.begin_item_group(label,condition)]
+        elif name == "ItemDefinitionGroup":
+            return [name,visitor.begin_item_definition_group(label,condition)]
+        elif name == "PropertyGroup":
+            return [name,visitor.begin_property_group(label,condition)]
+        elif name == "ImportGroup":
+            return [name,visitor.begin_import_group(label,condition)]
+        else:
+            return None
+
+    def __end_group(self,group,visitor):
+        name,accepted = group
+
+        if   name == "ItemGroup":
+            visitor.end_item_group()
+        elif name == "ItemDefinitionGroup":
+            visitor.end_item_definition_group()
+        elif name == "PropertyGroup":
+            if accepted:
+                visitor.end_property_group()
+        elif name == "ImportGroup":
+            if accepted:
+                visitor.end_import_group()
+
+    def __walk_top_element(self,element,visitor):
+        name = _local_name(element.tag)
+
+        if name == "Import":
+            self.__walk_import(element,visitor)
+        else:
+            visitor.on_unknown_element(name)
+
+    def __walk_group_child(self,group_name,child,visitor):
+        name = _local_name(child.tag)
+
+        if   group_name == "ItemGroup":
+            if name == "ProjectConfiguration":
+                visitor.process_project_configuration()
+            elif name == "ClInclude":
+                self.__walk_clinclude_item(child,visitor)
+            elif name == "ClCompile":
+                self.__walk_clcompile_item(child,visitor)
+            elif name == "ProjectReference":
+                self.__walk_project_reference(child,visitor)
+            else:
+                visitor.on_unknown_item(name)
+        elif group_name == "ItemDefinitionGroup":
+            if name == "ClCompile":
+                self.__walk_clcompile_definition(child,visitor)
+            elif name == "Link":
+                self.__walk_link_definition(child,visitor)
+            else:
+                visitor.on_unknown_item_definition(name)
+        elif group_name == "PropertyGroup":
+            visitor.process_property(name,_get_element_text(child))
+        elif group_name == "ImportGroup":
+            if name == "Import":
+                self.__walk_import(child,visitor)
+            else:
+                raise RuntimeError("invalid element (%s) in <ImportGroup>" % (name))
+
+    def __walk_clinclude_item(self,clinclude_element,visitor):
+        for child in _enumerate_child_elements(clinclude_element):
+            name = _local_name(child.tag)
+
+            if name == "ExcludedFromBuild":
+                pass
+            else:
+                raise RuntimeError("ClInclude element's contains unsupported subelement (%s)" % (name))
+
+        visitor.process_clinclude_item(_get_element_attr(clinclude_element,"Include"))
+
+    def __walk_clcompile_item(self,clcompile_element,visitor):
+        if "Condition" in clcompile_element.attrib:
+            raise RuntimeError("unsupported Condition attribute in ClCompile element")
+
+        if visitor.begin_clcompile_item(_get_element_attr(clcompile_element,"Include")):
+            for child in _enumerate_child_elements(clcompile_element):
+                name = _local_name(child.tag)
+
+                if name == "ExcludedFromBuild":
+                    text = _get_element_text(child).strip()
+                    if text=="":
+                        value = False
+                    else:
+                        value = _str_to_bool(text)
+                    visitor.process_clcompile_excluded_from_build(value,_get_element_attr(child,"Condition"))
+                elif name == "AdditionalOptions":
+                    visitor.process_clcompile_additional_options(_get_element_text(child),_get_element_attr(child,"Condition"))
+                elif name == "Optimization":
+                    visitor.process_clcompile_optimization_element(_get_element_text(child),_get_element_attr(child,"Condition"))
+                elif name == "PrecompiledHeader":
+                    visitor.process_clcompile_precompiled_header(_get_element_text(child),_get_element_attr_opt(child,"Condition"))
+                else:
+                    visitor.on_unknown_clcompile_element(name)
+
+            visitor.end_clcompile_item()
+
+    def __walk_project_reference(self,reference_element,visitor):
+        items = []
+
+        for child in _enumerate_child_elements(reference_element):
+            items.append((_local_name(child.tag),_get_element_text(child)))
+
+        visitor.process_project_reference(_get_element_attr(reference_element,"Include"),
+                                          _get_element_attr_opt(reference_element,"Condition"),
+                                          items)
+
+    def __walk_clcompile_definition(self,clcompile_element,visitor):
+        if len(clcompile_element.attrib) > 0:
+            raise RuntimeError("unexpected attribute in ClCompile definition")
+
+        items = []
+
+        for child in _enumerate_child_elements(clcompile_element):
+            items.append((_local_name(child.tag),_get_element_text(child)))
+
+        visitor.process_clcompile_definition(items)
+
+    def __walk_link_definition(self,link_element,visitor):
+        if len(link_element.attrib) > 0:
+            raise RuntimeError("unexpected attribute in Link definition")
+
+        items = []
+
+        for child in _enumerate_child_elements(link_element):
+            items.append((_local_name(child.tag),_get_element_text(child)))
+
+        visitor.process_link_definition(items)
+
+    def __walk_import(self,import_element,visitor):
+        project_name = _get_element_attr(import_element,"Project")
+        import_filename = visitor.begin_import(project_name,_get_element_attr_opt(import_element,"Condition"))
+
+        if import_filename is not None:
+            if type(import_filename) is list or type(import_filename) is tuple:
+                projs = import_filename
+            else:
+                projs = [ import_filename ]
+
+            for proj in projs:
+                subprj = StreamingProjectWalker(project_name,proj)
+
+                subprj.__walk_subproject(visitor)
+
+            visitor.end_import()
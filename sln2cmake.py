@@ -6,40 +6,66 @@ The tool designed to convert Microsoft Visual Studio .sln files with Linux C++ p
 You can customize operation by overwriting Setup object with your methods.
 """
 
+from __future__ import print_function
+
 import sys
 import re
 import os
 import os.path
-import traceback
+import fnmatch
+import multiprocessing
+import hashlib
+import json
+import pickle
+import tempfile
+import copy
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 __author__  = "OpenLab: https://github.com/openlab-vn-ua"
 __license__ = "MIT"
 __version__ = "1.0.5"
 
+from mssln.Compat import Mapping,load_source,native_str
+
 SLN2CMAKE_CONFIG_USER='sln2cmake_config_user'
-if os.path.exists('sln2cmake_config_user.py'):
-    # use sln2cmake_config_user if it exists
-    # from sln2cmake_config_user import Setup # may not work in case we run script from different start folder
-    # use sln2cmake_config_user if it exists
-    import imp
-    SetupMod = imp.load_source(SLN2CMAKE_CONFIG_USER, './'+SLN2CMAKE_CONFIG_USER+'.py')
-    Setup = SetupMod.Setup
-elif os.path.exists('../'+SLN2CMAKE_CONFIG_USER+'.py'):
-    # use ../sln2cmake_config_user if it exists
-    import imp
-    SetupMod = imp.load_source(SLN2CMAKE_CONFIG_USER, '../'+SLN2CMAKE_CONFIG_USER+'.py')
-    Setup = SetupMod.Setup
-else:
-    # import empty setup file
-    from sln2cmake_config import Setup
+SLN2CMAKE_CONFIG_DEFAULT_FILENAME=os.path.join(os.path.dirname(os.path.abspath(__file__)),'sln2cmake_config.py')
+SLN2CMAKE_CONFIG_USER_FILENAMES=['./'+SLN2CMAKE_CONFIG_USER+'.py','../'+SLN2CMAKE_CONFIG_USER+'.py'] # tried by load_setup() in this order
+
+def load_setup():
+    # returns Setup and name of file it is loaded from
+    if os.path.exists('sln2cmake_config_user.py'):
+        # use sln2cmake_config_user if it exists
+        # from sln2cmake_config_user import Setup # may not work in case we run script from different start folder
+        # use sln2cmake_config_user if it exists
+        SetupMod = load_source(SLN2CMAKE_CONFIG_USER, './'+SLN2CMAKE_CONFIG_USER+'.py')
+        return SetupMod.Setup,'./'+SLN2CMAKE_CONFIG_USER+'.py'
+    elif os.path.exists('../'+SLN2CMAKE_CONFIG_USER+'.py'):
+        # use ../sln2cmake_config_user if it exists
+        SetupMod = load_source(SLN2CMAKE_CONFIG_USER, '../'+SLN2CMAKE_CONFIG_USER+'.py')
+        return SetupMod.Setup,'../'+SLN2CMAKE_CONFIG_USER+'.py'
+    else:
+        # import empty setup file
+        from sln2cmake_config import Setup
+        return Setup,SLN2CMAKE_CONFIG_DEFAULT_FILENAME
+
+import sln2cmake_config
 
 from mssln.Solution import Solution
-from mssln.ProjectWalker import ProjectWalker,ProjectVisitor
+from mssln.ProjectWalker import ProjectWalker,ProjectVisitor,MultiplexProjectVisitor,release_document
+from mssln.StreamingProjectWalker import StreamingProjectWalker
 from mssln.Evaluator import Environment,evaluate_expression,substitute_vars
+import mssln.Stats as Stats
+import mssln.Log as Log
+from mssln.FileWatcher import FileWatcher
 
 FPIC_OPTION_GCC="-fpic"
 
-IGNORED_PROJECTS = [] if Setup.get_ignored_projects() == None else Setup.get_ignored_projects()
+def get_ignored_projects(setup):
+    return [] if setup.get_ignored_projects() == None else setup.get_ignored_projects()
 
 INSTALL_SUBDIR_SHARED_LIB = "lib"
 INSTALL_SUBDIR_STATIC_LIB = "static_lib"
@@ -48,9 +74,10 @@ INSTALL_SUBDIR_EXECUTABLE = "bin"
 PLATFORM_LIST      = ( "x64","ARM" )
 CONFIGURATION_LIST = ( "Debug", "Release" )
 
-MAIN_CMAKELISTS_FILE_HEADER = """
-cmake_minimum_required (VERSION 3.0)
+CMAKE_MINIMUM_VERSION           = "3.0"
+CMAKE_UNITY_PCH_MINIMUM_VERSION = "3.16" # UNITY_BUILD, target_precompile_headers()
 
+MAIN_CMAKELISTS_FILE_HEAD = """
 project (TheProject)
 
 set(CMAKE_INSTALL_PREFIX "")
@@ -61,7 +88,9 @@ else()
 set (X86 1)
 endif()
 
-"""+Setup.cmake_root_get_after_head_section()+"""
+"""
+
+MAIN_CMAKELISTS_FILE_FLAGS = """
 
 set(CMAKE_C_FLAGS "-std=c11")
 set(CMAKE_CXX_FLAGS "-std=c++11")
@@ -100,31 +129,122 @@ set(CMAKE_EXE_LINKER_FLAGS "${CMAKE_EXE_LINKER_FLAGS} -Wl,--no-undefined -Wl,-z,
 
 """
 
-def get_file_list_by_mask(mask):
-    star_index = mask.find('*')
+def format_main_cmakelists_file_header(setup):
+    return MAIN_CMAKELISTS_FILE_HEAD+setup.cmake_root_get_after_head_section()+MAIN_CMAKELISTS_FILE_FLAGS
+
+class DirectoryIndex:
+    # in-memory index of directories scanned by wildcard imports: every
+    # directory is listed once, then masks are answered from memory
 
-    if star_index < 0:
-        return [mask]
+    def __init__(self):
+        self.entries = {} # dir -> (names in listing order,names of subdirectories)
 
-    full_prefix = mask[:star_index]
-    dir_prefix  = os.path.dirname(full_prefix)
-    name_prefix = os.path.basename(full_prefix)
-    name_suffix = mask[star_index + 1:]
+    def clear(self):
+        self.entries.clear()
 
-    if len(dir_prefix) == 0:
-        dir_prefix = "."
+    def get_entry(self,path):
+        entry = self.entries.get(path)
 
-    result = []
+        if entry is None:
+            names   = []
+            subdirs = set()
 
-    for name in os.listdir(dir_prefix):
-        if name.startswith(name_prefix) and name.endswith(name_suffix):
-            if len(name) >= len(name_prefix) + len(name_suffix):
-                result.append(os.path.join(dir_prefix,name))
+            if hasattr(os,"scandir"):
+                for dir_entry in os.scandir(path):
+                    names.append(dir_entry.name)
 
-    return result
+                    if dir_entry.is_dir():
+                        subdirs.add(dir_entry.name)
+            else:
+                for name in os.listdir(path):
+                    names.append(name)
+
+                    if os.path.isdir(os.path.join(path,name)):
+                        subdirs.add(name)
+
+            entry = (names,subdirs)
+
+            self.entries[path] = entry
+
+        return entry
+
+    def list_dir(self,path):
+        return self.get_entry(path)[0]
+
+    def walk_dirs(self,path):
+        result = [path]
+
+        for name in sorted(self.get_entry(path)[1]):
+            result.extend(self.walk_dirs(os.path.join(path,name)))
+
+        return result
+
+    def find(self,mask):
+        star_index = mask.find('*')
+
+        if star_index < 0:
+            return [mask]
+
+        recursive_index = mask.find("**")
+
+        if recursive_index >= 0 and recursive_index == star_index:
+            return self.find_recursive(mask[:recursive_index],mask[recursive_index + 2:])
+
+        full_prefix = mask[:star_index]
+        dir_prefix  = os.path.dirname(full_prefix)
+        name_prefix = os.path.basename(full_prefix)
+        name_suffix = mask[star_index + 1:]
+
+        if len(dir_prefix) == 0:
+            dir_prefix = "."
+
+        result = []
+
+        for name in self.list_dir(dir_prefix):
+            if name.startswith(name_prefix) and name.endswith(name_suffix):
+                if len(name) >= len(name_prefix) + len(name_suffix):
+                    result.append(os.path.join(dir_prefix,name))
+
+        return result
+
+    def find_recursive(self,base_prefix,name_mask):
+        # "<base>/**/<name mask>" - name mask is matched in base and every directory below it
+        base_dir  = base_prefix.rstrip("/\\")
+        name_mask = name_mask.lstrip("/\\")
+
+        if len(base_dir) == 0:
+            base_dir = "."
+
+        if not os.path.isdir(base_dir):
+            return []
+
+        name_re = re.compile(fnmatch.translate(name_mask))
+        result  = []
+
+        for path in self.walk_dirs(base_dir):
+            subdirs = self.get_entry(path)[1]
+
+            for name in self.list_dir(path):
+                if name not in subdirs and name_re.match(name):
+                    result.append(os.path.join(path,name))
+
+        return result
+
+# ignored imports regular expressions list -> single compiled matcher
+_ignored_imports_matchers = {}
+
+def get_ignored_imports_matcher(ignored_list):
+    key     = tuple(ignored_list)
+    matcher = _ignored_imports_matchers.get(key)
+
+    if matcher is None:
+        matcher = re.compile("|".join(map(lambda x : "(?:%s)" % (x),key)))
+        _ignored_imports_matchers[key] = matcher
+
+    return matcher
 
 def split_string_normalized(s,separator=';'):
-    return filter(lambda y : len(y) > 0,map(lambda x : x.strip(),s.split(separator)))
+    return list(filter(lambda y : len(y) > 0,map(lambda x : x.strip(),s.split(separator))))
 
 def path_normalize_slashes(path):
     skip   = True
@@ -152,6 +272,7 @@ class CMakeProjectInfo:
     def __init__(self):
         self.project_name                   = None
         self.project_filename               = None
+        self.solution_project_filename      = None # project file name output layout follows
         self.configuration_type             = None
         self.compile_items                  = []
         self.library_dependencies           = []
@@ -163,11 +284,42 @@ class CMakeProjectInfo:
         self.compile_pic                    = False
         self.additional_link_options        = []
         self.user_load_data                 = UserData()
+        self.input_filenames                = []
+        self.project_references             = []
+        self.dependencies                   = [] # resolved project_references
+        self.unity_batch_size               = 0  # 0 - unity build is off
+        self.precompiled_header             = "" # PrecompiledHeader (Use,Create,NotUsing)
+        self.precompiled_header_file        = ""
+        self.pch_header                     = None # header to precompile (None - no PCH)
+        self.pch_reuse_from                 = None # target to reuse PCH from
+        self.job_pool_compile               = None # ninja job pools (None - no pool)
+        self.job_pool_link                  = None
+        self.object_libraries               = [] # names of shared object libraries linked into target
+        self.owned_object_libraries         = [] # shared object libraries defined with target
+
+class ObjectLibraryItem:
+    def __init__(self,name):
+        self.name                 = name
+        self.sources              = [] # (path relative to owner project,add_options)
+        self.position_independent = False # linked into shared library
+
+class ProjectReferenceItem:
+    def __init__(self,filename,guid,link):
+        self.filename = filename # absolute path of referenced project file
+        self.guid     = guid     # upper case, without braces (None if not specified)
+        self.link     = link     # LinkLibraryDependencies
+
+class ProjectDependencyItem:
+    def __init__(self,name,link):
+        self.name = name # target name
+        self.link = link # link with target (or just build it before)
 
 class CompileItem:
     def __init__(self,include=None):
-        self.include     = include
-        self.add_options = []
+        self.include        = include
+        self.add_options    = []
+        self.unity_excluded = False
+        self.precompiled_header = None # per-file PrecompiledHeader value (None if not overridden)
 
 class LibraryDependencyItem:
     def __init__(self,name):
@@ -190,11 +342,15 @@ class MetaSubEnvironment(Environment):
         self.meta[name] = value
 
     def get_meta_var(self,name):
-        if self.meta.has_key(name):
+        if name in self.meta:
             return self.meta[name]
         else:
             return self.parent.get_meta_var(name)
 
+    def get_meta_var_opt(self,name,defval=""):
+        # does not warn about undefined variable
+        return self.meta.get(name,defval)
+
 class CMakeGeneratorEnvironment(Environment):
     def __init__(self,initital_vars):
         Environment.__init__(self,initital_vars)
@@ -202,6 +358,8 @@ class CMakeGeneratorEnvironment(Environment):
         self.clcompile_env = MetaSubEnvironment("ClCompile",self)
         self.link_env      = MetaSubEnvironment("Link",self)
 
+        self.file_var_reads = None # [(name,value)] while prefix snapshot is recorded
+
     def set_var(self,name,value):
         if name == "RemoteRootDir":
             # ignore RemoteRootDir setup - it should be filled already
@@ -212,7 +370,7 @@ class CMakeGeneratorEnvironment(Environment):
     def set_visitor(self,visitor):
         self.visitor = visitor
 
-    def get_undefined_var(self,name):
+    def get_file_var(self,name):
         if name == "MSBuildThisFileName":
             return os.path.splitext(os.path.basename(self.visitor.get_current_filename()))[0]
         elif name == "MSBuildProjectFile":
@@ -220,12 +378,25 @@ class CMakeGeneratorEnvironment(Environment):
         elif name == "MSBuildProjectName":
             return self.visitor.get_project_name()
         else:
-            print "warning: access to undefined variable %s" % (name)
+            return None
+
+    def get_undefined_var(self,name):
+        value = self.get_file_var(name)
+
+        if value is None:
+            Log.logger.warning("access to undefined variable %s",name)
             return ""
 
+        # name of imported file depends on import chain only, which is checked separately
+        if self.file_var_reads is not None and (name != "MSBuildThisFileName" or len(self.visitor.import_projects_stack) == 1):
+            self.file_var_reads.append((name,value))
+
+        return value
+
 class CMakeGeneratorVisitor(ProjectVisitor):
-    def __init__(self,env):
+    def __init__(self,env,context):
         self.env = env
+        self.context = context
         self.compile_items = []
         self.curr_compile_item = None
         self.project_info = CMakeProjectInfo()
@@ -233,8 +404,11 @@ class CMakeGeneratorVisitor(ProjectVisitor):
 
         self.ignored_imports_list = []
         self.import_projects_stack = []
+        self.input_filenames = [] # project, imported files and wildcard import dirs
+        self.project_references = []
+        self.prefix_snapshot = None # PrefixSnapshot being recorded
 
-        Setup.on_load_init(self)
+        context.setup.on_load_init(self)
 
     def get_current_filename(self):
         return self.import_projects_stack[-1]
@@ -245,14 +419,21 @@ class CMakeGeneratorVisitor(ProjectVisitor):
     def get_project_filename(self):
         return self.import_projects_stack[0]
 
+    def add_input_filename(self,filename):
+        filename = os.path.abspath(filename)
+
+        if filename not in self.input_filenames:
+            self.input_filenames.append(filename)
+
     def add_ignored_import(self,ignored_re):
         self.ignored_imports_list.append(ignored_re)
 
     def begin_project(self,name,filename):
-        print "parsing ",name,"(%s)..." % (filename)
+        Log.logger.log(Log.VERBOSE,"parsing %s (%s)...",name,filename)
 
         self.project_name = name
         self.import_projects_stack.append(filename)
+        self.add_input_filename(filename)
 
         self.project_info.project_name     = name
         self.project_info.project_filename = filename
@@ -261,13 +442,17 @@ class CMakeGeneratorVisitor(ProjectVisitor):
 
     def end_project(self):
         self.project_info.compile_items = self.compile_items
-        self.project_info.library_dependencies = map(lambda x : LibraryDependencyItem(x),split_string_normalized(self.env.link_env.get_meta_var("LibraryDependencies")))
+        self.project_info.library_dependencies = list(map(lambda x : LibraryDependencyItem(x),split_string_normalized(self.env.link_env.get_meta_var("LibraryDependencies"))))
         self.project_info.additional_library_directories = split_string_normalized(self.env.link_env.get_meta_var("AdditionalLibraryDirectories"))
-        self.project_info.include_dirs = map(lambda x : path_normalize_slashes(x),split_string_normalized(self.env.get_var("IncludePath")))
+        self.project_info.include_dirs = list(map(lambda x : path_normalize_slashes(x),split_string_normalized(self.env.get_var("IncludePath"))))
         self.project_info.defines      = split_string_normalized(self.env.clcompile_env.get_meta_var("PreprocessorDefinitions"))
         self.project_info.configuration_type = self.env.get_var("ConfigurationType")
         self.project_info.project_master_path = self.env.get_var("ProjectMasterPath")
         self.project_info.user_load_data = self.user_load_data
+        self.project_info.input_filenames = self.input_filenames
+        self.project_info.project_references = self.project_references
+        self.project_info.precompiled_header = self.env.clcompile_env.get_meta_var_opt("PrecompiledHeader")
+        self.project_info.precompiled_header_file = self.env.clcompile_env.get_meta_var_opt("PrecompiledHeaderFile")
         self.project_info.additional_compile_options = split_string_normalized(self.env.clcompile_env.get_meta_var("AdditionalOptions"),None)
         self.project_info.compile_pic            = self.env.clcompile_env.get_meta_var("PositionIndependentCode") == "true"
         self.project_info.additional_link_options = split_string_normalized(self.env.link_env.get_meta_var("AdditionalOptions"),None)
@@ -280,7 +465,7 @@ class CMakeGeneratorVisitor(ProjectVisitor):
         if self.project_info.project_name.startswith("lib"):
             self.project_info.project_name = self.project_info.project_name[3:]
 
-        Setup.on_load_done(self, self.project_info)
+        self.context.setup.on_load_done(self, self.project_info)
 
     def begin_item_group(self,label,condition):
         if condition is not None:
@@ -333,10 +518,20 @@ class CMakeGeneratorVisitor(ProjectVisitor):
         if evaluated_value == "Disabled":
             self.curr_compile_item.add_options.append("-O0")
         else:
-            raise RuntimeError,"unsupported optimization value (%s) in project file" % (evaluated_value)
+            raise RuntimeError("unsupported optimization value (%s) in project file" % (evaluated_value))
+
+    def process_clcompile_precompiled_header(self,value,condition):
+        if self.curr_compile_item is None:
+            return
+
+        if condition is not None:
+            if not evaluate_expression(condition,self.env):
+                return
+
+        self.curr_compile_item.precompiled_header = evaluate_expression(value,self.env)
 
     def on_unknown_clcompile_element(self,name):
-        print "warning: unknown ClCompile element - ",name
+        Log.logger.warning("unknown ClCompile element - %s",name)
 
     def begin_property_group(self,label,condition):
         if condition is not None:
@@ -371,8 +566,19 @@ class CMakeGeneratorVisitor(ProjectVisitor):
         pass
 
     def begin_subproject(self,name,filename):
-        print "including file",name,"(%s)..." % (filename)
+        Log.logger.debug("including file %s (%s)...",name,filename)
+
+        importers = list(map(os.path.abspath,self.import_projects_stack))
+
+        if os.path.abspath(filename) in importers:
+            cycle = importers[importers.index(os.path.abspath(filename)):] + [os.path.abspath(filename)]
+            raise RuntimeError("import cycle detected (%s)" % (" -> ".join(cycle)))
+
         self.import_projects_stack.append(filename)
+        self.add_input_filename(filename)
+
+        if Stats.current is not None:
+            Stats.current.count("imports_followed")
 
         return True
 
@@ -380,6 +586,19 @@ class CMakeGeneratorVisitor(ProjectVisitor):
         self.import_projects_stack = self.import_projects_stack[:-1]
 
     def begin_import(self,project,condition):
+        stats = Stats.current
+
+        if stats is None:
+            return self._resolve_import(project,condition)
+
+        stats.begin("import_resolve")
+
+        try:
+            return self._resolve_import(project,condition)
+        finally:
+            stats.end()
+
+    def _resolve_import(self,project,condition):
         ignore = False if condition is None else evaluate_expression(condition,self.env)
 
         if ignore:
@@ -390,17 +609,32 @@ class CMakeGeneratorVisitor(ProjectVisitor):
         if self._is_in_ignored_imports_list(filename):
             return None
 
+        result = self.find_import_files(filename,self.import_projects_stack[-1])
+
+        if type(result) is list:
+            filename_list = result
+            mask          = os.path.join(os.path.dirname(self.import_projects_stack[-1]),filename)
+            self.add_input_filename(os.path.dirname(mask[:mask.find('*')]) or ".")
+        else:
+            filename_list = [ result ]
+
+        if self.prefix_snapshot is not None:
+            self.prefix_snapshot.record_import(self,filename,result,filename_list)
+
+        self.context.setup.on_load_import_file_list(self, filename_list)
+
+        return result
+
+    def find_import_files(self,filename,importer_filename):
+        # returns file name or list of files matching wildcard mask
         star_index = filename.find('*')
 
         if not os.path.isabs(filename):
-            filename = os.path.join(os.path.dirname(self.import_projects_stack[-1]),filename)
+            filename = os.path.join(os.path.dirname(importer_filename),filename)
 
         if star_index >= 0:
-            filename_list = filter(lambda x : not self._is_in_ignored_imports_list(x),get_file_list_by_mask(filename))
-            Setup.on_load_import_file_list(self, filename_list)
-            return filename_list
+            return list(filter(lambda x : not self._is_in_ignored_imports_list(x),self.context.directory_index.find(filename)))
         else:
-            Setup.on_load_import_file_list(self, [ filename ])
             return filename
 
     def end_import(self):
@@ -409,34 +643,37 @@ class CMakeGeneratorVisitor(ProjectVisitor):
     def end_item_group(self):
         pass
 
+    def process_project_reference(self,include,condition,items):
+        if condition is not None and not evaluate_expression(condition,self.env):
+            return
+
+        include_value = evaluate_expression(include,self.env).replace("\\","/")
+        filename      = os.path.abspath(os.path.join(os.path.dirname(self.get_project_filename()),include_value))
+        guid          = None
+        link          = True
+
+        for name,value in items:
+            if name == "Project":
+                guid = value.strip().strip("{}").upper()
+            elif name == "LinkLibraryDependencies":
+                link = value.strip().lower() != "false"
+
+        self.project_references.append(ProjectReferenceItem(filename,guid,link))
+
     def on_unknown_item(self,name):
-        print "warning: unknown item - ",name
+        Log.logger.warning("unknown item - %s",name)
 
     def on_unknown_element(self,name):
-        print "warning: unknown element - ",name
+        Log.logger.warning("unknown element - %s",name)
 
     def on_unknown_item_definition(self,name):
-        print "unknown item definition - ",name
+        Log.logger.warning("unknown item definition - %s",name)
 
     def _is_in_ignored_imports_list(self,import_name):
-        for rexpr in self.ignored_imports_list:
-            if re.match(rexpr,import_name):
-                return True
-        return False
-
-def make_path(path):
-    path = path_normalize_slashes(path)
-    subdirs = path.split('/')
-    currdir = subdirs[0]
-
-    if not os.path.exists(currdir):
-        os.mkdir(currdir)
-
-    for subdir in subdirs[1:]:
-        currdir = os.path.join(currdir,subdir)
+        if len(self.ignored_imports_list) == 0:
+            return False
 
-        if not os.path.exists(currdir):
-            os.mkdir(currdir)
+        return get_ignored_imports_matcher(self.ignored_imports_list).match(import_name) is not None
 
 def cmake_get_var_name_sources(project):
     return project.project_name.upper() + "_SRCS"
@@ -450,13 +687,21 @@ def cmake_get_var_name_incdirs(project):
 def cmake_get_var_name_defines(project):
     return project.project_name.upper() + "_DEFINES"
 
+def get_sources_list(project):
+    sources = list(map(lambda x : path_normalize_slashes(x.include),project.compile_items))
+
+    for name in project.object_libraries:
+        sources.append("$<TARGET_OBJECTS:%s>" % (name))
+
+    return sources
+
 def cmake_generate_sources_list(cmake_file,project):
     var_name_sources = cmake_get_var_name_sources(project)
 
     cmake_file.write("set(%s\n" % (var_name_sources))
 
-    for compile_item in project.compile_items:
-        cmake_file.write("%s\n" % (path_normalize_slashes(compile_item.include)))
+    for source in get_sources_list(project):
+        cmake_file.write("%s\n" % (source))
 
     cmake_file.write(")\n\n")
 
@@ -494,8 +739,10 @@ def cmake_generate_defines_list(cmake_file,project):
         cmake_file.write(")\n\n")
 
 def cmake_generate_compile_options_section(cmake_file,project):
-#    if len(project.additional_compile_options) > 0 or project.compile_pic:
-    target_name = project.project_name
+    cmake_generate_target_compile_options_section(cmake_file,project)
+    cmake_generate_source_properties_section(cmake_file,project)
+
+def get_target_compile_options(project):
     options = project.additional_compile_options[:]
 
     if project.compile_pic:
@@ -504,14 +751,288 @@ def cmake_generate_compile_options_section(cmake_file,project):
     options.extend(map(lambda x : "-W" + x,project.cpp_additional_warning_default))
     options.extend(map(lambda x : "-W" + x,project.cpp_additional_warning))
 
+    return options
+
+def cmake_generate_target_compile_options_section(cmake_file,project):
+#    if len(project.additional_compile_options) > 0 or project.compile_pic:
+    target_name = project.project_name
+    options = get_target_compile_options(project)
+
     if len(options) > 0:
         cmake_file.write("target_compile_options(%s PRIVATE %s)\n\n" % (target_name,";".join(options)))
 
+def cmake_generate_source_properties_section(cmake_file,project):
     for compile_item in project.compile_items:
         if len(compile_item.add_options) > 0:
             cmake_file.write("set_source_files_properties(%s PROPERTIES COMPILE_FLAGS \"%s\")\n\n" %\
              (path_normalize_slashes(compile_item.include)," ".join(compile_item.add_options)))
 
+def cmake_generate_object_libraries_section(cmake_file,project):
+    # object libraries are compiled with flags of owner target (the same
+    # as flags of all other targets they are linked into)
+    for library in project.owned_object_libraries:
+        cmake_file.write("add_library(%s OBJECT\n" % (library.name))
+
+        for source,add_options in library.sources:
+            cmake_file.write("%s\n" % (source))
+
+        cmake_file.write(")\n")
+
+        if len(project.include_dirs) > 0:
+            cmake_file.write("target_include_directories(%s PRIVATE ${%s})\n" % (library.name,cmake_get_var_name_incdirs(project)))
+
+        if len(project.defines) > 0:
+            cmake_file.write("target_compile_definitions(%s PRIVATE ${%s})\n" % (library.name,cmake_get_var_name_defines(project)))
+
+        options = get_target_compile_options(project)
+
+        if len(options) > 0:
+            cmake_file.write("target_compile_options(%s PRIVATE %s)\n" % (library.name,";".join(options)))
+
+        if library.position_independent:
+            cmake_file.write("set_target_properties(%s PROPERTIES POSITION_INDEPENDENT_CODE ON)\n" % (library.name))
+
+        cmake_file.write("\n")
+
+        for source,add_options in library.sources:
+            if len(add_options) > 0:
+                cmake_file.write("set_source_files_properties(%s PROPERTIES COMPILE_FLAGS \"%s\")\n\n" % (source," ".join(add_options)))
+
+def get_project_relative_path_key(project,path):
+    path = path.replace("\\","/")
+
+    if path.startswith("${") or os.path.isabs(path):
+        return path
+    else:
+        return os.path.normpath(os.path.join(os.path.dirname(project.project_filename),path))
+
+def get_compile_flags_key(project,compile_item):
+    return (tuple(map(lambda x : get_project_relative_path_key(project,x),project.include_dirs)),
+            tuple(project.defines),
+            tuple(get_target_compile_options(project)),
+            tuple(compile_item.add_options))
+
+def assign_configuration_shared_objects(projects,divergent):
+    usages  = {} # source -> [(project,compile_item,flags)]
+    sources = [] # in order of first usage
+
+    for project in projects:
+        for compile_item in project.compile_items:
+            source = get_project_relative_path_key(project,compile_item.include)
+
+            if source not in usages:
+                usages[source] = []
+                sources.append(source)
+
+            usages[source].append((project,compile_item,get_compile_flags_key(project,compile_item)))
+
+    libraries = {} # (flags,consumer names) -> ObjectLibraryItem
+    shared    = set()
+
+    for source in sources:
+        usage = usages[source]
+        names = []
+
+        for project,compile_item,flags in usage:
+            if project.project_name not in names:
+                names.append(project.project_name)
+
+        if len(names) < 2 or len(names) != len(usage):
+            continue
+
+        if not is_same_for_all(list(map(lambda x : x[2],usage))):
+            divergent.setdefault(source,set()).update(names)
+            continue
+
+        key     = (usage[0][2],tuple(names))
+        library = libraries.get(key)
+
+        if library is None:
+            owner   = usage[0][0]
+            library = ObjectLibraryItem("%s_objs%d" % (owner.project_name,len(owner.owned_object_libraries)))
+
+            owner.owned_object_libraries.append(library)
+            libraries[key] = library
+
+            for project,compile_item,flags in usage:
+                project.object_libraries.append(library.name)
+
+            # cmake makes shared library sources PIC implicitly, but not OBJECT library ones
+            library.position_independent = any(map(lambda x : x[0].configuration_type == "DynamicLibrary",usage))
+
+        library.sources.append((path_normalize_slashes(usage[0][1].include),usage[0][1].add_options))
+
+        for project,compile_item,flags in usage:
+            shared.add(id(compile_item))
+
+    for project in projects:
+        project.compile_items = list(filter(lambda x : id(x) not in shared,project.compile_items))
+
+    return len(shared)
+
+def assign_shared_objects(project_packs):
+    # sources compiled with the same flags by several targets of the same
+    # configuration are compiled once into object library linked into all
+    configurations     = {}
+    configuration_list = []
+
+    for project_pack in project_packs:
+        for project in project_pack:
+            project.object_libraries       = []
+            project.owned_object_libraries = []
+
+            key = (project.configuration,project.platform)
+
+            if key not in configurations:
+                configurations[key] = []
+                configuration_list.append(key)
+
+            configurations[key].append(project)
+
+    divergent = {}
+    shared    = 0
+
+    for key in configuration_list:
+        shared += assign_configuration_shared_objects(configurations[key],divergent)
+
+    for source in sorted(divergent.keys()):
+        Log.logger.warning("source %s is shared by %s, but compiled with different flags",source,",".join(sorted(divergent[source])))
+
+    if Stats.current is not None:
+        Stats.current.count("shared_object_items",shared)
+        Stats.current.count("divergent_shared_sources",len(divergent))
+
+def cmake_generate_unity_build_section(cmake_file,project):
+    if project.unity_batch_size > 0:
+        target_name = project.project_name
+
+        cmake_file.write("set_target_properties(%s PROPERTIES UNITY_BUILD ON UNITY_BUILD_BATCH_SIZE %d)\n\n" % (target_name,project.unity_batch_size))
+
+def cmake_generate_unity_build_exclusions_section(cmake_file,project):
+    if project.unity_batch_size > 0:
+        # sources with own compile flags must not share unity source with others
+        excluded = list(filter(lambda x : x.unity_excluded or len(x.add_options) > 0,project.compile_items))
+
+        if len(excluded) > 0:
+            cmake_file.write("set_source_files_properties(\n")
+
+            for compile_item in excluded:
+                cmake_file.write("%s\n" % (path_normalize_slashes(compile_item.include)))
+
+            cmake_file.write("PROPERTIES SKIP_UNITY_BUILD_INCLUSION ON)\n\n")
+
+def prepare_unity_build(project,context):
+    project.unity_batch_size = context.get_setup_hook("cmake_get_unity_build_batch_size")(project)
+
+    if project.unity_batch_size > 0:
+        is_excluded = context.get_setup_hook("is_unity_build_excluded")
+
+        for compile_item in project.compile_items:
+            compile_item.unity_excluded = is_excluded(project,compile_item)
+
+def cmake_generate_precompiled_headers_section(cmake_file,project):
+    if project.pch_header is not None:
+        target_name = project.project_name
+
+        if project.pch_reuse_from is not None:
+            cmake_file.write("target_precompile_headers(%s REUSE_FROM %s)\n\n" % (target_name,project.pch_reuse_from))
+        else:
+            cmake_file.write("target_precompile_headers(%s PRIVATE %s)\n\n" % (target_name,path_normalize_slashes(project.pch_header)))
+
+def cmake_generate_precompiled_headers_exclusions_section(cmake_file,project):
+    if project.pch_header is not None:
+        excluded = list(filter(lambda x : x.precompiled_header == "NotUsing",project.compile_items))
+
+        if len(excluded) > 0:
+            cmake_file.write("set_source_files_properties(\n")
+
+            for compile_item in excluded:
+                cmake_file.write("%s\n" % (path_normalize_slashes(compile_item.include)))
+
+            cmake_file.write("PROPERTIES SKIP_PRECOMPILE_HEADERS ON)\n\n")
+
+def prepare_precompiled_header(project):
+    # per-file "Create" items are compiled as usual, cmake builds PCH itself
+    if project.precompiled_header not in ("Use","Create"):
+        project.pch_header = None
+    elif project.precompiled_header_file == "":
+        Log.logger.warning("project %s uses precompiled header, but PrecompiledHeaderFile is not set",project.project_name)
+        project.pch_header = None
+    else:
+        project.pch_header = project.precompiled_header_file
+
+def is_position_independent(project):
+    # cmake makes shared library sources PIC implicitly
+    return project.compile_pic or project.configuration_type == "DynamicLibrary"
+
+def get_precompiled_header_key(project):
+    # PCH may be reused only by targets compiled with the same header and flags
+    header = os.path.normpath(os.path.join(os.path.dirname(project.project_filename),path_normalize_slashes(project.pch_header)))
+
+    return (project.configuration,
+            project.platform,
+            header,
+            tuple(map(lambda x : get_project_relative_path_key(project,x),project.include_dirs)),
+            tuple(project.defines),
+            tuple(project.additional_compile_options),
+            is_position_independent(project),
+            tuple(project.cpp_additional_warning_default),
+            tuple(project.cpp_additional_warning))
+
+def assign_precompiled_header_reuse(project_packs):
+    owners = {}
+
+    for project_pack in project_packs:
+        for project in project_pack:
+            project.pch_reuse_from = None
+
+            if project.pch_header is None:
+                continue
+
+            key   = get_precompiled_header_key(project)
+            owner = owners.get(key)
+
+            if owner is None:
+                owners[key] = project.project_name
+            elif owner != project.project_name:
+                project.pch_reuse_from = owner
+
+def cmake_generate_job_pools_section(cmake_file,project):
+    properties = []
+
+    if project.job_pool_compile is not None:
+        properties.append("JOB_POOL_COMPILE %s" % (project.job_pool_compile))
+
+    if project.job_pool_link is not None:
+        properties.append("JOB_POOL_LINK %s" % (project.job_pool_link))
+
+    if len(properties) > 0:
+        cmake_file.write("set_target_properties(%s PROPERTIES %s)\n\n" % (project.project_name," ".join(properties)))
+
+def get_job_pools(context):
+    pools = context.get_setup_hook("cmake_get_job_pools")()
+
+    for name,size in pools:
+        if size < 1:
+            raise RuntimeError("invalid size (%s) of job pool %s" % (size,name))
+
+    return pools
+
+def prepare_job_pools(project,pools,context):
+    names = list(map(lambda x : x[0],pools))
+
+    project.job_pool_compile,project.job_pool_link = context.get_setup_hook("cmake_get_project_job_pools")(project)
+
+    for pool in (project.job_pool_compile,project.job_pool_link):
+        if pool is not None and pool not in names:
+            raise RuntimeError("project %s is assigned to unknown job pool (%s)" % (project.project_name,pool))
+
+def format_job_pools_section(pools):
+    if len(pools) == 0:
+        return ""
+
+    return "set_property(GLOBAL PROPERTY JOB_POOLS %s)\n\n" % (" ".join(map(lambda x : "%s=%d" % x,pools)))
+
 def cmake_generate_link_options_section(cmake_file,project):
     if len(project.additional_link_options) > 0 or len(project.additional_library_directories) > 0:
         target_name = project.project_name
@@ -546,6 +1067,16 @@ def cmake_generate_target_section(cmake_file,project):
     if len(project.defines) > 0:
         cmake_file.write("target_compile_definitions(%s PRIVATE ${%s})\n" % (target_name,cmake_get_var_name_defines(project)))
 
+    library_names = list(map(lambda x : x.name,project.library_dependencies))
+    link_targets  = list(map(lambda x : x.name,filter(lambda x : x.link and x.name not in library_names,project.dependencies)))
+    build_targets = list(map(lambda x : x.name,filter(lambda x : not x.link,project.dependencies)))
+
+    if len(link_targets) > 0:
+        cmake_file.write("target_link_libraries(%s LINK_PRIVATE %s)\n" % (target_name," ".join(link_targets)))
+
+    if len(build_targets) > 0:
+        cmake_file.write("add_dependencies(%s %s)\n" % (target_name," ".join(build_targets)))
+
     cmake_file.write("\n")
 
 def get_install_mode_by_configuration_type(conf_type):
@@ -573,180 +1104,1772 @@ def cmake_generate_install_section(cmake_file,project):
                      (get_install_mode_by_configuration_type(conf_type),
                       get_install_subdir_by_configuration_type(conf_type)))
 
+ROOT_DIR_CACHE_VAR = "SLN2CMAKE_ROOT_DIR"
+
+def make_root_relative_path(path,root_prefix):
+    normalized = path_normalize_slashes(path)
+
+    if normalized == root_prefix or normalized.startswith(root_prefix + "/"):
+        return "${" + ROOT_DIR_CACHE_VAR + "}" + normalized[len(root_prefix):]
+    else:
+        return path
+
+def make_root_relative_option(option,root_prefix):
+    for flag in ("-I","-L","-isystem"):
+        if option.startswith(flag) and len(option) > len(flag):
+            return flag + make_root_relative_path(option[len(flag):],root_prefix)
+
+    return option
+
+def prepare_root_relative_paths(project,remote_root_dir):
+    # paths under root dir refer to cache variable, so generated files do not
+    # depend on checkout location; cmake still passes absolute paths to the
+    # compiler, only ccache (CCACHE_BASEDIR) makes them relative for its hash
+    root_prefix = path_normalize_slashes(remote_root_dir)
+
+    if root_prefix == "":
+        return
+
+    project.include_dirs                   = list(map(lambda x : make_root_relative_path(x,root_prefix),project.include_dirs))
+    project.additional_library_directories = list(map(lambda x : make_root_relative_path(x,root_prefix),project.additional_library_directories))
+    project.additional_compile_options     = list(map(lambda x : make_root_relative_option(x,root_prefix),project.additional_compile_options))
+    project.additional_link_options        = list(map(lambda x : make_root_relative_option(x,root_prefix),project.additional_link_options))
+
+    for compile_item in project.compile_items:
+        compile_item.include     = make_root_relative_path(compile_item.include,root_prefix)
+        compile_item.add_options = list(map(lambda x : make_root_relative_option(x,root_prefix),compile_item.add_options))
+
+def format_compiler_cache_section(remote_root_dir,compiler_launcher,relative_paths):
+    lines = []
+
+    if relative_paths:
+        lines.append("set(%s \"%s\" CACHE PATH \"Root dir of sources (RemoteRootDir)\")\n\n" % (ROOT_DIR_CACHE_VAR,remote_root_dir))
+
+        for lang in ("C","CXX"):
+            lines.append("set(CMAKE_%s_FLAGS \"${CMAKE_%s_FLAGS} -fdebug-prefix-map=${%s}=.\")\n" % (lang,lang,ROOT_DIR_CACHE_VAR))
+
+        lines.append("\n")
+
+    if compiler_launcher is not None:
+        launcher = compiler_launcher
+
+        if relative_paths and os.path.basename(compiler_launcher).startswith("ccache"):
+            # ccache rewrites absolute paths under base dir to relative ones,
+            # other launchers (sccache) hash absolute paths as they are
+            launcher = "${CMAKE_COMMAND} -E env CCACHE_BASEDIR=${%s} %s" % (ROOT_DIR_CACHE_VAR,compiler_launcher)
+
+        for lang in ("C","CXX"):
+            lines.append("set(CMAKE_%s_COMPILER_LAUNCHER %s)\n" % (lang,launcher))
+
+        lines.append("\n")
+
+    return "".join(lines)
+
 def path_remove_trailing_twodots_entries(path):
     while (path.startswith("../") or path.startswith("..\\")):
         path = path[3:]
 
     return path
 
+def get_layout_project_filename(sln_filename,project):
+    # output dirs follow project file path as given (relative to current dir,
+    # as in older versions) unless solution path is absolute, then follow
+    # project path relative to solution dir (absolute path would escape dest dir)
+    if os.path.isabs(sln_filename):
+        return os.path.normpath(path_normalize_slashes(project.filename))
+    else:
+        return os.path.normpath(os.path.join(os.path.dirname(sln_filename),path_normalize_slashes(project.filename)))
+
 def format_dest_project_dir(project,dest_base_dir):
-    filename = path_remove_trailing_twodots_entries(project.project_filename)
+    filename = path_remove_trailing_twodots_entries(project.solution_project_filename)
 
     return os.path.join(dest_base_dir,os.path.dirname(filename))
 
 def format_project_cmake_filename(project_name,platform,configuration):
     return project_name + "-" + platform + "-" + configuration + ".cmake"
 
-def generate_cmake_for_project(project,dest_base_dir):
-    print "Project name: %s project file name: %s" % (project.project_name,project.project_filename)
-    destdir = format_dest_project_dir(project,dest_base_dir)
+def format_project_common_cmake_filename(project_name):
+    return project_name + "-common.cmake"
 
-    make_path(destdir)
+if hasattr(os,"replace"):
+    _replace_file = os.replace
+else:
+    def _replace_file(src,dest):
+        # rename() does not overwrite existing file on Windows
+        if os.name == "nt" and os.path.exists(dest):
+            os.remove(dest)
 
-    project_cmake_filename = os.path.join(destdir,format_project_cmake_filename(project.project_name,project.platform,project.configuration))
+        os.rename(src,dest)
 
-    with open(project_cmake_filename,"wt") as cmake_file:
+def _get_new_file_mode():
+    umask = os.umask(0)
+    os.umask(umask)
 
-        Setup.cmake_generate_begin(cmake_file,project)
-        cmake_generate_sources_list(cmake_file,project)
-        cmake_generate_library_dependencies_list(cmake_file,project)
-        cmake_generate_include_dirs_list(cmake_file,project)
-        cmake_generate_defines_list(cmake_file,project)
-        cmake_generate_target_section(cmake_file,project)
-        cmake_generate_compile_options_section(cmake_file,project)
-        cmake_generate_link_options_section(cmake_file,project)
-        cmake_generate_install_section(cmake_file,project)
-        Setup.cmake_generate_end(cmake_file,project)
+    return 0o666 & ~umask
 
-        cmake_file.close()
+class OutputFiles:
+    # Output files are rendered in memory and replaced only if their content
+    # differs from the one on disk, so unchanged files keep their mtimes and
+    # do not make cmake to re-run configure step
 
-def format_include_list(project_names,platform,configuration):
-    return "\n".join(map(lambda x : "    include (%s)" % (format_project_cmake_filename(x,platform,configuration)),project_names)) + "\n"
+    def __init__(self):
+        self.file_mode = _get_new_file_mode()
+        self.plan      = None # [(filename,content)] collected instead of writing (see convert())
+        self.clear()
+
+    def clear(self):
+        self.updated   = 0
+        self.unchanged = 0
+
+    def is_unchanged(self,filename,content):
+        try:
+            with open(filename,"rt") as src:
+                return src.read() == content
+        except (IOError,OSError):
+            return False
+
+    def write(self,filename,content):
+        stats = Stats.current
+
+        if self.plan is not None:
+            self.plan.append((filename,content))
+            return True
 
-def generate_cmakelists(project_packs,dest_base_dir):
-    project_dirs = {}
+        if self.is_unchanged(filename,content):
+            self.unchanged += 1
 
-    for project_pack in project_packs:
-        project_dest_dir = format_dest_project_dir(project_pack[0],dest_base_dir)
+            if stats is not None:
+                stats.count("files_unchanged")
 
-        if project_dirs.has_key(project_dest_dir):
-            project_dirs[project_dest_dir].append(project_pack)
-        else:
-            project_dirs[project_dest_dir] = [project_pack]
+            return False
 
-    for project_dir,project_pack_list in project_dirs.iteritems():
-        with open(os.path.join(project_dir,"CMakeLists.txt"),"wt") as cmakelists_file:
-            project_names = map(lambda x : x[0].project_name,project_pack_list)
+        dest_dir = os.path.dirname(filename)
 
-            cmakelists_file.write("if (CMAKE_BUILD_TYPE STREQUAL \"Release\")\n")
-            cmakelists_file.write("  if (CMAKE_SYSTEM_PROCESSOR MATCHES \"(arm)\")\n")
-            cmakelists_file.write(format_include_list(project_names,"ARM","Release"))
-            cmakelists_file.write("  else()\n")
-            cmakelists_file.write(format_include_list(project_names,"x64","Release"))
-            cmakelists_file.write("  endif()\n")
-            cmakelists_file.write("else()\n")
-            cmakelists_file.write("  if (CMAKE_SYSTEM_PROCESSOR MATCHES \"(arm)\")\n")
-            cmakelists_file.write(format_include_list(project_names,"ARM","Debug"))
-            cmakelists_file.write("  else()\n")
-            cmakelists_file.write(format_include_list(project_names,"x64","Debug"))
-            cmakelists_file.write("  endif()\n")
-            cmakelists_file.write("endif()\n")
+        if dest_dir and not os.path.isdir(dest_dir):
+            os.makedirs(dest_dir)
 
-            cmakelists_file.close()
+        handle,temp_filename = tempfile.mkstemp(prefix="." + os.path.basename(filename) + ".",suffix=".tmp",dir=dest_dir or ".")
 
-    with open(os.path.join(dest_base_dir,"CMakeLists.txt"),"wt") as main_file:
-        main_file.write(MAIN_CMAKELISTS_FILE_HEADER)
+        try:
+            with os.fdopen(handle,"wt") as dest:
+                dest.write(content)
 
-        for project_dir in project_dirs.iterkeys():
-            main_file.write("add_subdirectory(%s)\n" % (path_remove_trailing_twodots_entries(path_normalize_slashes(os.path.dirname(project_dirs[project_dir][0][0].project_filename)))))
+            os.chmod(temp_filename,self.file_mode)
 
-        main_file.close()
+            _replace_file(temp_filename,filename)
+        except:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise
 
-INIT_ENV = { "VCTargetsPath" : "" }
+        self.updated += 1
 
-def convert_sln_to_cmakes(args):
-    sln_filename = args.sln_filename
-    remote_root_dir = args.root_dir
-    solution = Solution(sln_filename)
-    dest_base_dir = args.dest_dir if os.path.isabs(args.dest_dir) else os.path.normpath(args.dest_dir)
+        if stats is not None:
+            stats.count("files_written")
+            stats.count("bytes_written",len(content))
+
+        return True
 
-    if os.path.exists(dest_base_dir):
-        raise RuntimeError,"destination directory (%s) already exists" % (dest_base_dir)
+class ConversionContext:
+    # Setup and state of one conversion run (command line run, batch of
+    # solutions, convert() call): output files writer, directory listings and
+    # import prefix snapshots. Generator and loader functions get it instead
+    # of using module globals, so conversions with own contexts may run
+    # concurrently (in threads) in one process.
 
-    project_packs = []
+    def __init__(self,setup,config_filename,cache=None):
+        self.output_files     = OutputFiles()
+        self.directory_index  = DirectoryIndex() if cache is None else cache.directory_index
+        self.prefix_snapshots = {} if cache is None else cache.prefix_snapshots # prefix elements xml -> [PrefixSnapshot]
 
-    for project in solution.projects:
-        if project.filename == project.name:
-            pass # it's forward reference???
-        elif project.name in IGNORED_PROJECTS:
-            print "note: project %s is ignored (by ignored list)" % (project.name)
-            pass # it's not used and have strange "ExcludedFromBuild" value in .vcxproj
-        else:
-            project_filename = os.path.normpath(os.path.join(os.path.dirname(sln_filename),path_normalize_slashes(project.filename)))
+        self.use_setup(setup,config_filename)
 
-            project_pack = []
+    def use_setup(self,setup,config_filename):
+        self.setup           = setup
+        self.config_filename = config_filename
 
-            for configuration in CONFIGURATION_LIST:
-                for platform in PLATFORM_LIST:
-                    walker  = ProjectWalker(project.name,project_filename)
-                    env_dict = dict(INIT_ENV)
-                    env_dict["RemoteRootDir"] = remote_root_dir
+        self.ignored_projects            = get_ignored_projects(setup)
+        self.main_cmakelists_file_header = format_main_cmakelists_file_header(setup)
 
-                    env     = CMakeGeneratorEnvironment(env_dict)
-                    visitor = CMakeGeneratorVisitor(env)
+    def get_setup_hook(self,name):
+        # user config may be written for older version without newer hooks,
+        # default implementation is used for them
+        hook = getattr(self.setup,name,None)
 
-                    env.set_visitor(visitor)
+        if hook is None:
+            hook = getattr(sln2cmake_config.Setup,name)
 
-                    visitor.add_ignored_import(r"^\\Microsoft.Cpp.Default.props$")
-                    visitor.add_ignored_import(r"^\\Microsoft.Cpp.props$")
-                    visitor.add_ignored_import(r"^\\Microsoft.Cpp.targets$")
+        return hook
 
-                    env.set_var("Platform",platform)
-                    env.set_var("Configuration",configuration)
-                    env.set_var("LinkAdditionalOptionsLinuxStub","")
-                    env.set_var("IncludePath","")
-                    env.set_var("ISenseIncludePath","")
-                    env.set_var("TargetName",project.name)
+def generate_cmake_for_project(project,dest_base_dir,context):
+    Log.logger.log(Log.VERBOSE,"Project name: %s project file name: %s",project.project_name,project.project_filename)
+    destdir = format_dest_project_dir(project,dest_base_dir)
 
-                    env.set_meta_var("PreprocessorDefinitions","")
-                    env.set_meta_var("CAdditionalWarning","")
-                    env.set_meta_var("CppAdditionalWarning","")
-                    env.set_meta_var("AdditionalOptions","")
-                    env.set_meta_var("AdditionalLibraryDirectories","")
-                    env.set_meta_var("AdditionalIncludeDirectories","")
+    project_cmake_filename = os.path.join(destdir,format_project_cmake_filename(project.project_name,project.platform,project.configuration))
 
-                    walker.walk(visitor)
+    cmake_file = StringIO()
 
-                    visitor.project_info.platform      = platform
-                    visitor.project_info.configuration = configuration
+    context.setup.cmake_generate_begin(cmake_file,project)
+    cmake_generate_sources_list(cmake_file,project)
+    cmake_generate_library_dependencies_list(cmake_file,project)
+    cmake_generate_include_dirs_list(cmake_file,project)
+    cmake_generate_defines_list(cmake_file,project)
+    cmake_generate_target_section(cmake_file,project)
+    cmake_generate_compile_options_section(cmake_file,project)
+    cmake_generate_object_libraries_section(cmake_file,project)
+    cmake_generate_unity_build_section(cmake_file,project)
+    cmake_generate_unity_build_exclusions_section(cmake_file,project)
+    cmake_generate_precompiled_headers_section(cmake_file,project)
+    cmake_generate_precompiled_headers_exclusions_section(cmake_file,project)
+    cmake_generate_job_pools_section(cmake_file,project)
+    cmake_generate_link_options_section(cmake_file,project)
+    cmake_generate_install_section(cmake_file,project)
+    context.setup.cmake_generate_end(cmake_file,project)
 
-                    project_pack.append(visitor.project_info)
+    context.output_files.write(project_cmake_filename,cmake_file.getvalue())
 
-            project_packs.append(project_pack)
+    if Stats.current is not None:
+        Stats.current.count("compile_items_emitted",len(project.compile_items))
 
-    for project_pack in project_packs:
-        for project in project_pack:
-            Setup.proc_project_custom_params(project)
+# sections which define variables used by target section
+SHARED_PRE_TARGET_SECTIONS  = ( cmake_generate_library_dependencies_list,
+                                cmake_generate_include_dirs_list,
+                                cmake_generate_defines_list )
 
-    for project_pack in project_packs:
-        for project in project_pack:
-            generate_cmake_for_project(project,dest_base_dir)
+# sections which refer to target defined by target section
+SHARED_POST_TARGET_SECTIONS = ( cmake_generate_target_compile_options_section,
+                                cmake_generate_source_properties_section,
+                                cmake_generate_object_libraries_section,
+                                cmake_generate_unity_build_section,
+                                cmake_generate_unity_build_exclusions_section,
+                                cmake_generate_precompiled_headers_section,
+                                cmake_generate_precompiled_headers_exclusions_section,
+                                cmake_generate_job_pools_section,
+                                cmake_generate_link_options_section,
+                                cmake_generate_install_section )
 
-    generate_cmakelists(project_packs,dest_base_dir)
+def render_cmake_section(generator,project):
+    section = StringIO()
 
-class Arguments:
-    def __init__(self):
-        self.sln_filename = None
-        self.dest_dir     = None
-        self.root_dir     = None
+    generator(section,project)
 
-    def parse_command_line(self,args):
-        if len(args) != 3:
-            raise RuntimeError,"root dir, .sln file name and dest dir parameters required"
+    return section.getvalue()
 
-        self.root_dir     = args[0]
-        self.sln_filename = args[1]
-        self.dest_dir     = args[2]
+def is_same_for_all(values):
+    return values.count(values[0]) == len(values)
 
-def main():
-    args = Arguments()
-    args.parse_command_line(sys.argv[1:])
+def cmake_generate_shared_sources_list(common_file,config_files,project_pack):
+    sources = list(map(get_sources_list,project_pack))
 
-    try:
-        convert_sln_to_cmakes(args)
-    except RuntimeError,e:
-        print e
-        # traceback.print_exc()
+    if is_same_for_all(sources):
+        cmake_generate_sources_list(common_file,project_pack[0])
+        return
+
+    # sources used in all configurations are listed once, the rest are
+    # appended from per-configuration variable set before common file include
+    var_name_sources = cmake_get_var_name_sources(project_pack[0])
+    var_name_config  = project_pack[0].project_name.upper() + "_CONFIG_SRCS"
+
+    common = set(sources[0])
+
+    for config_sources in sources[1:]:
+        common.intersection_update(config_sources)
+
+    for config_file,config_sources in zip(config_files,sources):
+        config_file.write("set(%s\n" % (var_name_config))
+
+        for source in config_sources:
+            if source not in common:
+                config_file.write("%s\n" % (source))
+
+        config_file.write(")\n\n")
+
+    common_file.write("set(%s\n" % (var_name_sources))
+
+    for source in sources[0]:
+        if source in common:
+            common_file.write("%s\n" % (source))
+
+    common_file.write("${%s}\n" % (var_name_config))
+    common_file.write(")\n\n")
+
+def cmake_generate_shared_sections(common_file,config_files,project_pack,generators):
+    for generator in generators:
+        sections = list(map(lambda project : render_cmake_section(generator,project),project_pack))
+
+        if is_same_for_all(sections):
+            common_file.write(sections[0])
+        else:
+            for config_file,section in zip(config_files,sections):
+                config_file.write(section)
+
+def get_shared_project_groups(project_pack):
+    # configurations may define different target names (and so variable
+    # names), only configurations with the same name share common file
+    groups = {}
+    names  = []
+
+    for project in project_pack:
+        if project.project_name not in groups:
+            groups[project.project_name] = []
+            names.append(project.project_name)
+
+        groups[project.project_name].append(project)
+
+    return list(map(lambda name : groups[name],names))
+
+def generate_shared_cmake_for_project_pack(project_pack,dest_base_dir,context):
+    for projects in get_shared_project_groups(project_pack):
+        if len(projects) > 1:
+            generate_shared_cmake_for_projects(projects,dest_base_dir,context)
+        else:
+            generate_cmake_for_project(projects[0],dest_base_dir,context)
+
+def generate_shared_cmake_for_projects(project_pack,dest_base_dir,context):
+    # Configuration-invariant sections are written once to <name>-common.cmake
+    # which is included from every per-configuration file. Per-configuration
+    # file consists of begin hook, differing variable sections, common file
+    # include, differing target and post-target sections and end hook.
+    first   = project_pack[0]
+    destdir = format_dest_project_dir(first,dest_base_dir)
+
+    common_file  = StringIO()
+    config_files = list(map(lambda project : StringIO(),project_pack))
+
+    for project,config_file in zip(project_pack,config_files):
+        Log.logger.log(Log.VERBOSE,"Project name: %s project file name: %s",project.project_name,project.project_filename)
+        context.setup.cmake_generate_begin(config_file,project)
+
+    cmake_generate_shared_sources_list(common_file,config_files,project_pack)
+    cmake_generate_shared_sections(common_file,config_files,project_pack,SHARED_PRE_TARGET_SECTIONS)
+
+    target_sections = list(map(lambda project : render_cmake_section(cmake_generate_target_section,project),project_pack))
+    target_shared   = is_same_for_all(target_sections)
+
+    if target_shared:
+        common_file.write(target_sections[0])
+
+    for config_file in config_files:
+        config_file.write("include (%s)\n\n" % (format_project_common_cmake_filename(first.project_name)))
+
+    if target_shared:
+        cmake_generate_shared_sections(common_file,config_files,project_pack,SHARED_POST_TARGET_SECTIONS)
+    else:
+        # target is defined after common file include, so everything
+        # referring to it has to stay in per-configuration files
+        for project,config_file,section in zip(project_pack,config_files,target_sections):
+            config_file.write(section)
+
+            for generator in SHARED_POST_TARGET_SECTIONS:
+                generator(config_file,project)
+
+    for project,config_file in zip(project_pack,config_files):
+        context.setup.cmake_generate_end(config_file,project)
+
+        context.output_files.write(os.path.join(destdir,format_project_cmake_filename(project.project_name,project.platform,project.configuration)),config_file.getvalue())
+
+        if Stats.current is not None:
+            Stats.current.count("compile_items_emitted",len(project.compile_items))
+
+    context.output_files.write(os.path.join(destdir,format_project_common_cmake_filename(first.project_name)),common_file.getvalue())
+
+def find_project_configuration(project_pack,platform,configuration):
+    for project in project_pack:
+        if project.platform == platform and project.configuration == configuration:
+            return project
+
+    return None
+
+def format_include_list(project_pack_list,platform,configuration):
+    # only projects converted for the platform/configuration are included
+    lines = []
+
+    for project_pack in project_pack_list:
+        project = find_project_configuration(project_pack,platform,configuration)
+
+        if project is not None:
+            lines.append("    include (%s)\n" % (format_project_cmake_filename(project.project_name,platform,configuration)))
+
+    return "".join(lines)
+
+def sort_topologically(nodes,dependencies):
+    # dependencies: node -> list of nodes it depends on; dependencies are
+    # placed before dependents, otherwise original order of nodes is kept
+    result  = []
+    visited = set()
+    path    = []
+
+    def visit(node):
+        if node in path:
+            Log.logger.warning("circular dependency (%s)"," -> ".join(map(str,path[path.index(node):] + [node])))
+            return
+
+        if node in visited:
+            return
+
+        path.append(node)
+
+        for dependency in dependencies.get(node,[]):
+            visit(dependency)
+
+        path.pop()
+
+        visited.add(node)
+        result.append(node)
+
+    for node in nodes:
+        visit(node)
+
+    return result
+
+def resolve_project_references(project_packs,project_keys):
+    # fills project.dependencies from project.project_references, returns
+    # list of indices of referenced project packs for every project pack
+    by_guid = {}
+    by_key  = {}
+
+    for index,(project_key,project_name,project_guid) in enumerate(project_keys):
+        by_guid[project_guid.upper()] = index
+        by_key[project_key]           = index
+
+    references = []
+
+    for project_pack in project_packs:
+        referenced = []
+
+        for project in project_pack:
+            project.dependencies = []
+
+            for reference in project.project_references:
+                index = by_guid.get(reference.guid)
+
+                if index is None:
+                    index = by_key.get(reference.filename)
+
+                if index is None:
+                    Log.logger.warning("project %s references %s which is not converted",project.project_name,reference.filename)
+                    continue
+
+                target = find_project_configuration(project_packs[index],project.platform,project.configuration)
+
+                if target is None:
+                    Log.logger.warning("project %s references %s which is not converted for %s|%s",project.project_name,reference.filename,project.configuration,project.platform)
+                    continue
+
+                link = reference.link and target.configuration_type in ("StaticLibrary","DynamicLibrary")
+
+                if target.project_name not in map(lambda x : x.name,project.dependencies):
+                    project.dependencies.append(ProjectDependencyItem(target.project_name,link))
+
+                if index not in referenced:
+                    referenced.append(index)
+
+        references.append(referenced)
+
+    return references
+
+def generate_cmakelists(project_packs,dest_base_dir,references,context,root_section="",cmake_minimum_version=CMAKE_MINIMUM_VERSION):
+    project_dirs     = {}
+    project_dir_list = []
+    pack_dirs        = []
+
+    for project_pack in project_packs:
+        project_dest_dir = format_dest_project_dir(project_pack[0],dest_base_dir)
+
+        if project_dest_dir in project_dirs:
+            project_dirs[project_dest_dir].append(project_pack)
+        else:
+            project_dirs[project_dest_dir] = [project_pack]
+            project_dir_list.append(project_dest_dir)
+
+        pack_dirs.append(project_dest_dir)
+
+    # subdirectories of referenced projects are added before referencing ones
+    dir_dependencies = {}
+
+    for index,referenced in enumerate(references):
+        for referenced_index in referenced:
+            if pack_dirs[referenced_index] != pack_dirs[index]:
+                dir_dependencies.setdefault(pack_dirs[index],[]).append(pack_dirs[referenced_index])
+
+    project_dir_list = sort_topologically(project_dir_list,dir_dependencies)
+
+    for project_dir in project_dir_list:
+        project_pack_list = project_dirs[project_dir]
+
+        cmakelists_file = StringIO()
+
+        cmakelists_file.write("if (CMAKE_BUILD_TYPE STREQUAL \"Release\")\n")
+        cmakelists_file.write("  if (CMAKE_SYSTEM_PROCESSOR MATCHES \"(arm)\")\n")
+        cmakelists_file.write(format_include_list(project_pack_list,"ARM","Release"))
+        cmakelists_file.write("  else()\n")
+        cmakelists_file.write(format_include_list(project_pack_list,"x64","Release"))
+        cmakelists_file.write("  endif()\n")
+        cmakelists_file.write("else()\n")
+        cmakelists_file.write("  if (CMAKE_SYSTEM_PROCESSOR MATCHES \"(arm)\")\n")
+        cmakelists_file.write(format_include_list(project_pack_list,"ARM","Debug"))
+        cmakelists_file.write("  else()\n")
+        cmakelists_file.write(format_include_list(project_pack_list,"x64","Debug"))
+        cmakelists_file.write("  endif()\n")
+        cmakelists_file.write("endif()\n")
+
+        context.output_files.write(os.path.join(project_dir,"CMakeLists.txt"),cmakelists_file.getvalue())
+
+    main_file = StringIO()
+
+    main_file.write("\ncmake_minimum_required (VERSION %s)\n" % (cmake_minimum_version))
+    main_file.write(context.main_cmakelists_file_header)
+    main_file.write(root_section)
+
+    for project_dir in project_dir_list:
+        main_file.write("add_subdirectory(%s)\n" % (path_remove_trailing_twodots_entries(path_normalize_slashes(os.path.dirname(project_dirs[project_dir][0][0].solution_project_filename)))))
+
+    context.output_files.write(os.path.join(dest_base_dir,"CMakeLists.txt"),main_file.getvalue())
+
+INIT_ENV = { "VCTargetsPath" : "" }
+
+def create_project_loader(project_name,remote_root_dir,configuration,platform,context):
+    env_dict = dict(INIT_ENV)
+    env_dict["RemoteRootDir"] = remote_root_dir
+
+    env     = CMakeGeneratorEnvironment(env_dict)
+    visitor = CMakeGeneratorVisitor(env,context)
+
+    env.set_visitor(visitor)
+
+    visitor.add_ignored_import(r"^\\Microsoft.Cpp.Default.props$")
+    visitor.add_ignored_import(r"^\\Microsoft.Cpp.props$")
+    visitor.add_ignored_import(r"^\\Microsoft.Cpp.targets$")
+
+    env.set_var("Platform",platform)
+    env.set_var("Configuration",configuration)
+    env.set_var("LinkAdditionalOptionsLinuxStub","")
+    env.set_var("IncludePath","")
+    env.set_var("ISenseIncludePath","")
+    env.set_var("TargetName",project_name)
+
+    env.set_meta_var("PreprocessorDefinitions","")
+    env.set_meta_var("CAdditionalWarning","")
+    env.set_meta_var("CppAdditionalWarning","")
+    env.set_meta_var("AdditionalOptions","")
+    env.set_meta_var("AdditionalLibraryDirectories","")
+    env.set_meta_var("AdditionalIncludeDirectories","")
+
+    return visitor
+
+def finish_project_loader(visitor,configuration,platform):
+    visitor.project_info.platform      = platform
+    visitor.project_info.configuration = configuration
+
+    return visitor.project_info
+
+class LayeredDict(Mapping):
+    # copy-on-write view of snapshot dictionary: the base is shared by all
+    # forks and never modified, writes go to fork's own layer
+
+    def __init__(self,base,layer=None):
+        self.base  = base
+        self.layer = dict(layer) if layer is not None else {}
+
+    def __contains__(self,name):
+        return name in self.layer or name in self.base
+
+    def __getitem__(self,name):
+        if name in self.layer:
+            return self.layer[name]
+        else:
+            return self.base[name]
+
+    def __setitem__(self,name,value):
+        self.layer[name] = value
+
+    def get(self,name,defval=None):
+        if name in self.layer:
+            return self.layer[name]
+        else:
+            return self.base.get(name,defval)
+
+    def __iter__(self):
+        for name in self.base:
+            yield name
+
+        for name in self.layer:
+            if name not in self.base:
+                yield name
+
+    def __len__(self):
+        return len(self.base) + len([ name for name in self.layer if name not in self.base ])
+
+    # lists, as keys(), values() and items() of dict on Python 2
+
+    def keys(self):
+        return list(iter(self))
+
+    def values(self):
+        return [ self[name] for name in self ]
+
+    def items(self):
+        return [ (name,self[name]) for name in self ]
+
+class TrackingDict(dict):
+    # records values of names read before they were written (prefix inputs)
+    # and names written (prefix outputs)
+
+    def __init__(self,initial):
+        dict.__init__(self,initial)
+
+        self.reads  = {}
+        self.writes = set()
+
+    def __note_read(self,name):
+        if name not in self.writes and name not in self.reads:
+            self.reads[name] = dict.get(self,name)
+
+    def __contains__(self,name):
+        self.__note_read(name)
+        return dict.__contains__(self,name)
+
+    def __getitem__(self,name):
+        self.__note_read(name)
+        return dict.__getitem__(self,name)
+
+    def get(self,name,defval=None):
+        self.__note_read(name)
+        return dict.get(self,name,defval)
+
+    def __setitem__(self,name,value):
+        self.writes.add(name)
+        dict.__setitem__(self,name,value)
+
+def get_env_dicts(env):
+    return [ env.vars,env.meta,env.clcompile_env.meta,env.link_env.meta ]
+
+def set_env_dicts(env,dicts):
+    env.vars,env.meta,env.clcompile_env.meta,env.link_env.meta = dicts
+
+class PrefixSnapshot:
+    # Loader state after leading imports of project file. The snapshot may be
+    # forked for other project (or configuration) if everything the prefix
+    # has read is the same: initial variables, project file name dependent
+    # variables and files the top-level imports resolve to.
+
+    def __init__(self):
+        self.reusable     = True
+        self.imports      = [] # [(evaluated file name,resolved absolute file name(s))] of top-level imports
+        self.import_lists = [] # Setup.on_load_import_file_list arguments, replayed on fork
+        self.state        = None
+
+    def begin(self,visitor):
+        set_env_dicts(visitor.env,[ TrackingDict(d) for d in get_env_dicts(visitor.env) ])
+
+        visitor.env.file_var_reads = []
+        visitor.prefix_snapshot    = self
+
+        self.compile_items_count      = len(visitor.compile_items)
+        self.project_references_count = len(visitor.project_references)
+
+    def end(self,visitor):
+        dicts = get_env_dicts(visitor.env)
+
+        self.reads          = [ d.reads for d in dicts ]
+        self.writes         = [ d.writes for d in dicts ]
+        self.state          = [ dict(d) for d in dicts ]
+        self.file_var_reads = visitor.env.file_var_reads
+
+        # items are relative to project file, so they can't be shared
+        if len(visitor.compile_items) != self.compile_items_count or len(visitor.project_references) != self.project_references_count:
+            self.reusable = False
+
+        self.input_filenames = [ filename for filename in visitor.input_filenames if filename != os.path.abspath(visitor.get_project_filename()) ]
+
+        set_env_dicts(visitor.env,[ dict(d) for d in self.state ])
+
+        visitor.env.file_var_reads = None
+        visitor.prefix_snapshot    = None
+
+    def record_import(self,visitor,filename,result,filename_list):
+        if len(visitor.import_projects_stack) == 1:
+            self.imports.append((filename,self.__get_abs_filenames(result)))
+
+        self.import_lists.append(list(filename_list))
+
+    def __get_abs_filenames(self,result):
+        if type(result) is list:
+            return list(map(os.path.abspath,result))
+        else:
+            return os.path.abspath(result)
+
+    def matches(self,visitor):
+        for reads,d in zip(self.reads,get_env_dicts(visitor.env)):
+            for name,value in reads.items():
+                if d.get(name) != value:
+                    return False
+
+        for name,value in self.file_var_reads:
+            if visitor.env.get_file_var(name) != value:
+                return False
+
+        for filename,abs_filenames in self.imports:
+            if self.__get_abs_filenames(visitor.find_import_files(filename,visitor.get_project_filename())) != abs_filenames:
+                return False
+
+        return True
+
+    def fork(self,visitor):
+        dicts = []
+
+        for state,writes,d in zip(self.state,self.writes,get_env_dicts(visitor.env)):
+            # initial values not overwritten by prefix are project's own
+            dicts.append(LayeredDict(state,[ (name,value) for name,value in d.items() if name not in writes ]))
+
+        set_env_dicts(visitor.env,dicts)
+
+        for filename in self.input_filenames:
+            visitor.add_input_filename(filename)
+
+        # hooks see final prefix state here instead of intermediate one
+        for filename_list in self.import_lists:
+            visitor.context.setup.on_load_import_file_list(visitor,list(filename_list))
+
+class PrefixForkingProjectWalker(ProjectWalker):
+    # DOM walker which evaluates project's import prefix (see
+    # ProjectWalker.get_import_prefix) once for all projects sharing it
+    def walk(self,visitor):
+        prefix = self.get_import_prefix()
+
+        if len(prefix) == 0:
+            ProjectWalker.walk(self,visitor)
+            return
+
+        visitor.begin_project(self.name,self.filename)
+
+        key      = tuple([ element.toxml() for element in prefix ])
+        snapshot = None
+
+        prefix_snapshots = visitor.context.prefix_snapshots
+
+        for candidate in prefix_snapshots.get(key,[]):
+            if candidate.matches(visitor):
+                snapshot = candidate
+                break
+
+        if snapshot is not None:
+            snapshot.fork(visitor)
+
+            if Stats.current is not None:
+                Stats.current.count("prefix_forks")
+        else:
+            snapshot = PrefixSnapshot()
+            snapshot.begin(visitor)
+
+            self.walk_elements(visitor,0,len(prefix))
+
+            snapshot.end(visitor)
+
+            if snapshot.reusable:
+                prefix_snapshots.setdefault(key,[]).append(snapshot)
+
+            if Stats.current is not None:
+                Stats.current.count("prefix_snapshots")
+
+        self.walk_elements(visitor,len(prefix))
+
+        visitor.end_project()
+
+def load_project_configuration(walker_class,project_name,project_filename,remote_root_dir,configuration,platform,context):
+    walker  = walker_class(project_name,project_filename)
+    visitor = create_project_loader(project_name,remote_root_dir,configuration,platform,context)
+
+    walker.walk(visitor)
+
+    return finish_project_loader(visitor,configuration,platform)
+
+def get_configuration_matrix(configuration_list,platform_list):
+    return [ (configuration,platform) for configuration in configuration_list for platform in platform_list ]
+
+def get_project_configurations(project,solution,matrix):
+    # without ProjectConfigurationPlatforms section every project is converted for whole matrix
+    if not project.has_configurations():
+        return matrix
+
+    declared = project.get_build_configurations(solution.configurations)
+
+    return [ configuration for configuration in matrix if configuration in declared ]
+
+def walk_project_pack(context,walker_class,project_name,project_filename,remote_root_dir,single_pass,configurations):
+    try:
+        if not single_pass:
+            return [ load_project_configuration(walker_class,project_name,project_filename,remote_root_dir,configuration,platform,context)
+                     for configuration,platform in configurations ]
+
+        # walk project once, every configuration is a separate lane of multiplex visitor
+        visitors = [ create_project_loader(project_name,remote_root_dir,configuration,platform,context)
+                     for configuration,platform in configurations ]
+
+        # lanes reading the same values (everything not depending on configuration
+        # and platform) reuse results evaluated by the first of them
+        shared_results = {}
+
+        for visitor in visitors:
+            for env in (visitor.env,visitor.env.clcompile_env,visitor.env.link_env):
+                env.shared_results = shared_results
+
+        walker_class(project_name,project_filename).walk(MultiplexProjectVisitor(visitors))
+
+        return [ finish_project_loader(visitor,configuration,platform)
+                 for visitor,(configuration,platform) in zip(visitors,configurations) ]
+    finally:
+        # project document is not needed after all its configurations are walked
+        release_document(project_filename)
+
+# task is (walker_class,project_name,project_filename,remote_root_dir,single_pass,configurations) tuple
+def load_project_pack(task,context):
+    stats = Stats.current
+
+    if stats is None:
+        return walk_project_pack(context,*task)
+
+    stats.begin_project(task[1],"load")
+    stats.begin("project_load")
+
+    try:
+        return walk_project_pack(context,*task)
+    finally:
+        stats.end()
+        stats.end_project()
+
+# context of pool worker process, set by init_load_worker()
+_worker_context = None
+
+# module-level function to be usable as multiprocessing pool worker
+def load_project_pack_in_worker(task_and_stats):
+    # worker process statistics and repeated warnings are sent back with loaded pack
+    task,collect_stats,trace_allocations = task_and_stats
+    warnings                             = Log.get_repeated_warnings()
+
+    if not collect_stats:
+        Stats.current = None
+        return (load_project_pack(task,_worker_context),None,Log.get_repeated_warnings_since(warnings))
+
+    Stats.current = Stats.RunStats(trace_allocations)
+
+    project_pack = load_project_pack(task,_worker_context)
+
+    return (project_pack,Stats.current.to_dict(),Log.get_repeated_warnings_since(warnings))
+
+def get_load_worker_setup(context):
+    # init_load_worker() arguments: user config loaded by load_source() can't
+    # be unpickled in spawned worker, so it is loaded there again by file name
+    stats_proxy = isinstance(context.setup,StatsSetupProxy)
+    setup       = context.setup.setup if stats_proxy else context.setup
+
+    if getattr(setup,"__module__",None) == SLN2CMAKE_CONFIG_USER:
+        setup = None
+
+    return (setup,context.config_filename,stats_proxy,Log.get_verbosity())
+
+def init_load_worker(setup,config_filename,stats_proxy,verbosity):
+    # worker does not rely on globals inherited by fork (spawn and forkserver start methods)
+    global _worker_context
+
+    if setup is None:
+        setup = load_source(SLN2CMAKE_CONFIG_USER,config_filename).Setup
+
+    if stats_proxy:
+        setup = StatsSetupProxy(setup)
+
+    _worker_context = ConversionContext(setup,config_filename)
+
+    if verbosity is not None:
+        Log.setup(verbosity)
+
+def load_project_packs(tasks,jobs,context):
+    if jobs <= 1 or len(tasks) <= 1:
+        return [ load_project_pack(task,context) for task in tasks ]
+
+    # loader hooks (Setup.on_load_*) are called in worker processes,
+    # results (including user_load_data) are pickled back in tasks order
+    pool = multiprocessing.Pool(min(jobs,len(tasks)),init_load_worker,get_load_worker_setup(context))
+
+    collect_stats     = Stats.current is not None
+    trace_allocations = collect_stats and Stats.current.trace_allocations
+
+    try:
+        project_packs = []
+
+        for project_pack,worker_stats,repeated_warnings in pool.map(load_project_pack_in_worker,[ (task,collect_stats,trace_allocations) for task in tasks ],1):
+            if worker_stats is not None:
+                Stats.current.merge(worker_stats)
+
+            Log.merge_repeated_warnings(repeated_warnings)
+            project_packs.append(project_pack)
+
+        return project_packs
+    finally:
+        pool.close()
+        pool.join()
+
+MANIFEST_FILENAME = ".sln2cmake_manifest.json"
+MODELS_FILENAME   = ".sln2cmake_models.pickle"
+IMPORTS_FILENAME  = ".sln2cmake_imports.json"
+
+def get_input_digest(filename):
+    if os.path.isdir(filename):
+        data = "\n".join(sorted(os.listdir(filename)))
+
+        if not isinstance(data,bytes):
+            data = data.encode("utf-8")
+    else:
+        with open(filename,"rb") as src:
+            data = src.read()
+
+    return hashlib.sha1(data).hexdigest()
+
+def get_input_signature(filename):
+    st = os.stat(filename)
+
+    return [st.st_mtime,st.st_size,get_input_digest(filename)]
+
+def is_input_unchanged(filename,signature):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return False
+
+    if st.st_mtime == signature[0] and st.st_size == signature[1]:
+        return True
+
+    if get_input_digest(filename) != signature[2]:
+        return False
+
+    # touched, but not changed - remember new timestamp
+    signature[0] = st.st_mtime
+    signature[1] = st.st_size
+
+    return True
+
+class IncrementalManifest:
+    # keeps signatures of every input of every project and loaded project models
+    # between runs, so only projects with changed inputs have to be walked again
+
+    def __init__(self,dest_base_dir,context):
+        self.filename        = os.path.join(dest_base_dir,MANIFEST_FILENAME)
+        self.models_filename = os.path.join(dest_base_dir,MODELS_FILENAME)
+        self.context         = context
+        self.projects        = {}
+        self.models          = {}
+
+    def load(self):
+        try:
+            with open(self.filename,"rt") as src:
+                data = json.load(src)
+
+            if data.get("context") != self.context:
+                Log.logger.info("tool version, config or options are changed, all projects will be regenerated")
+                return
+
+            with open(self.models_filename,"rb") as src:
+                models = pickle.load(src)
+
+            self.projects = data["projects"]
+            self.models   = models
+        except (IOError,ValueError,KeyError,pickle.UnpicklingError,AttributeError,ImportError,EOFError):
+            self.projects = {}
+            self.models   = {}
+
+    def get_unchanged_project_pack(self,key,project_name,configurations):
+        entry = self.projects.get(key)
+        model = self.models.get(key)
+
+        if entry is None or model is None or entry["name"] != project_name:
+            return None
+
+        if entry["configurations"] != list(map(list,configurations)):
+            return None
+
+        for filename,signature in entry["inputs"].items():
+            if not is_input_unchanged(filename,signature):
+                return None
+
+        return pickle.loads(model)
+
+    def set_project_pack(self,key,project_name,project_pack):
+        inputs = {}
+
+        for project in project_pack:
+            for filename in project.input_filenames:
+                if filename not in inputs:
+                    inputs[filename] = get_input_signature(filename)
+
+        self.projects[key] = { "name"           : project_name,
+                               "configurations" : list(map(lambda x : [x.configuration,x.platform],project_pack)),
+                               "inputs"         : inputs }
+        self.models[key]   = pickle.dumps(project_pack,pickle.HIGHEST_PROTOCOL)
+
+    def save(self):
+        with open(self.models_filename,"wb") as dest:
+            pickle.dump(self.models,dest,pickle.HIGHEST_PROTOCOL)
+
+        with open(self.filename,"wt") as dest:
+            json.dump({ "context" : self.context, "projects" : self.projects },dest,indent=1,sort_keys=True)
+
+# version of pickled project models format
+MODELS_FORMAT = 6
+
+class ProjectModelCache:
+    # Project packs loaded by conversions sharing the cache (batch mode,
+    # convert() calls): a pack is reused when the same project file is loaded
+    # with the same solution project name, root dir, configurations, walker
+    # and setup and none of its inputs changed. Packs are kept pickled, as
+    # conversion modifies loaded models.
+
+    def __init__(self):
+        self.packs            = {} # key -> (input signatures,pickled pack)
+        self.directory_index  = DirectoryIndex() # listings and snapshots of conversions given the cache
+        self.prefix_snapshots = {}
+
+    def __get_key(self,task,setup):
+        walker_class,project_name,project_filename,remote_root_dir,single_pass,configurations = task
+
+        return (os.path.abspath(project_filename),project_name,remote_root_dir,walker_class,single_pass,tuple(configurations),setup)
+
+    def get_project_pack(self,task,setup):
+        entry = self.packs.get(self.__get_key(task,setup))
+
+        if entry is None:
+            return None
+
+        for filename,signature in entry[0].items():
+            if get_file_signature(filename) != signature:
+                return None
+
+        if Stats.current is not None:
+            Stats.current.count("model_cache_hits")
+
+        return pickle.loads(entry[1])
+
+    def set_project_pack(self,task,setup,project_pack):
+        signatures = {}
+
+        for project in project_pack:
+            for filename in project.input_filenames:
+                signatures[filename] = get_file_signature(filename)
+
+        self.packs[self.__get_key(task,setup)] = (signatures,pickle.dumps(project_pack,pickle.HIGHEST_PROTOCOL))
+
+def get_file_signature(filename):
+    try:
+        st = os.stat(filename)
+    except (IOError,OSError):
+        return None
+
+    return (st.st_mtime,st.st_size)
+
+def get_incremental_context(remote_root_dir,output_options,config_filename):
+    return { "version"        : __version__,
+             "models_format"  : MODELS_FORMAT,
+             "python"         : "%d.%d" % sys.version_info[:2],
+             "config"         : get_input_digest(config_filename),
+             "root_dir"       : remote_root_dir,
+             "output_options" : output_options }
+
+def is_project_pack_output_present(project_pack,dest_base_dir,shared_common):
+    if shared_common:
+        for projects in get_shared_project_groups(project_pack):
+            destdir = format_dest_project_dir(projects[0],dest_base_dir)
+
+            if len(projects) > 1 and not os.path.exists(os.path.join(destdir,format_project_common_cmake_filename(projects[0].project_name))):
+                return False
+
+    for project in project_pack:
+        destdir = format_dest_project_dir(project,dest_base_dir)
+
+        if not os.path.exists(os.path.join(destdir,format_project_cmake_filename(project.project_name,project.platform,project.configuration))):
+            return False
+
+    return True
+
+def build_imports_index(project_packs,project_keys):
+    # imported file (or wildcard import dir) -> [project,configuration,platform]
+    index = {}
+
+    for project_pack,(project_key,project_name,project_guid) in zip(project_packs,project_keys):
+        for project in project_pack:
+            for filename in project.input_filenames:
+                if filename != project_key:
+                    index.setdefault(filename,[]).append([project_name,project.configuration,project.platform])
+
+    for users in index.values():
+        users.sort()
+
+    return index
+
+def write_imports_index(dest_base_dir,index,output_files):
+    output_files.write(os.path.join(dest_base_dir,IMPORTS_FILENAME),json.dumps(index,indent=1,sort_keys=True,separators=(",",": ")) + "\n")
+
+def get_affected_projects(dest_base_dir,filename):
+    try:
+        with open(os.path.join(dest_base_dir,IMPORTS_FILENAME),"rt") as src:
+            index = json.load(src)
+    except (IOError,ValueError):
+        raise RuntimeError("imports index is not found in %s, convert solution first" % (dest_base_dir))
+
+    filename = os.path.abspath(filename)
+    affected = set()
+
+    # new file in directory used by wildcard import affects its importers as well
+    for key in (filename,os.path.dirname(filename)):
+        for user in index.get(key,[]):
+            affected.add(tuple(user))
+
+    return sorted(affected)
+
+_solution_cache = {}
+
+SOLUTION_CACHE_LIMIT = 100
+
+def load_solution(filename):
+    # solution is parsed again only if its file was changed (watch mode)
+    key       = os.path.abspath(filename)
+    st        = os.stat(filename)
+    signature = (st.st_mtime,st.st_size)
+    entry     = _solution_cache.get(key)
+
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+
+    solution = Solution(filename)
+
+    if len(_solution_cache) >= SOLUTION_CACHE_LIMIT:
+        _solution_cache.clear()
+
+    _solution_cache[key] = (signature,solution)
+
+    return solution
+
+def convert_sln_to_cmakes(args,context,manifest=None,cache=None):
+    # returns list of converted project packs
+    sln_filename = args.sln_filename
+    remote_root_dir = args.root_dir
+    stats = Stats.current
+
+    if stats is not None:
+        stats.begin("sln_parse")
+
+    solution = load_solution(sln_filename)
+
+    if stats is not None:
+        stats.end()
+
+    dest_base_dir = args.dest_dir if os.path.isabs(args.dest_dir) else os.path.normpath(args.dest_dir)
+
+    output_files = context.output_files
+
+    if os.path.exists(dest_base_dir) and not args.incremental and output_files.plan is None:
+        raise RuntimeError("destination directory (%s) already exists" % (dest_base_dir))
+
+    # directories may have changed since previous run in the same process,
+    # conversions sharing cache (batch) see the same files
+    if cache is None:
+        context.directory_index.clear()
+        context.prefix_snapshots.clear()
+
+    output_files.clear()
+
+    if args.streaming:
+        walker_class = StreamingProjectWalker
+    elif args.fork_prefix:
+        walker_class = PrefixForkingProjectWalker
+    else:
+        walker_class = ProjectWalker
+
+    if manifest is None and args.incremental:
+        manifest = IncrementalManifest(dest_base_dir,get_incremental_context(remote_root_dir,args.get_output_options(),context.config_filename))
+        manifest.load()
+
+    matrix = get_configuration_matrix(args.configurations or CONFIGURATION_LIST,args.platforms or PLATFORM_LIST)
+
+    project_packs = []
+    project_keys  = []
+    project_paths = [] # project file names output layout follows
+    tasks         = []
+    task_indices  = [] # indices of (re)loaded packs
+    load_indices  = [] # indices of packs loaded by tasks
+
+    for project in solution.projects:
+        if project.filename == project.name:
+            pass # it's forward reference???
+        elif project.name in context.ignored_projects:
+            Log.logger.info("project %s is ignored (by ignored list)",project.name)
+            pass # it's not used and have strange "ExcludedFromBuild" value in .vcxproj
+        elif len(get_project_configurations(project,solution,matrix)) == 0:
+            Log.logger.info("project %s is skipped (not built in any of converted configurations)",project.name)
+        else:
+            project_filename = os.path.normpath(os.path.join(os.path.dirname(sln_filename),path_normalize_slashes(project.filename)))
+            project_key      = os.path.abspath(project_filename)
+            configurations   = get_project_configurations(project,solution,matrix)
+            task             = (walker_class,project.name,project_filename,remote_root_dir,args.single_pass,configurations)
+
+            project_pack = None
+
+            if manifest is not None:
+                project_pack = manifest.get_unchanged_project_pack(project_key,project.name,configurations)
+
+            if project_pack is None:
+                task_indices.append(len(project_packs))
+
+                if cache is not None:
+                    project_pack = cache.get_project_pack(task,context.setup)
+
+                if project_pack is None:
+                    load_indices.append(len(project_packs))
+                    tasks.append(task)
+
+            project_packs.append(project_pack)
+            project_keys.append((project_key,project.name,project.prj_uuid))
+            project_paths.append(get_layout_project_filename(sln_filename,project))
+
+    for index,task,project_pack in zip(load_indices,tasks,load_project_packs(tasks,args.jobs,context)):
+        project_packs[index] = project_pack
+
+        if cache is not None:
+            cache.set_project_pack(task,context.setup,project_pack)
+
+    if manifest is not None:
+        for index in task_indices:
+            manifest.set_project_pack(project_keys[index][0],project_keys[index][1],project_packs[index])
+
+        Log.logger.info("%d of %d projects are up to date",len(project_packs) - len(task_indices),len(project_packs))
+
+    for project_pack,project_path in zip(project_packs,project_paths):
+        for project in project_pack:
+            project.solution_project_filename = project_path
+
+    references = resolve_project_references(project_packs,project_keys)
+    job_pools  = get_job_pools(context) if args.job_pools else None
+
+    for project_pack in project_packs:
+        for project in project_pack:
+            if args.unity:
+                prepare_unity_build(project,context)
+
+            if args.pch:
+                prepare_precompiled_header(project)
+
+            if args.relative_paths:
+                prepare_root_relative_paths(project,remote_root_dir)
+
+            if job_pools is not None:
+                prepare_job_pools(project,job_pools,context)
+
+            context.setup.proc_project_custom_params(project)
+
+    # compile flags may be changed by proc_project_custom_params
+    if args.shared_objects:
+        assign_shared_objects(project_packs)
+
+    if args.pch:
+        assign_precompiled_header_reuse(project_packs)
+
+    # output depends on names and types of referenced targets as well
+    loaded_indices = set(task_indices)
+
+    for index,referenced in enumerate(references):
+        for referenced_index in referenced:
+            if referenced_index in task_indices:
+                loaded_indices.add(index)
+
+    # sharing of sources is solution-wide, so any change may affect all projects
+    if args.shared_objects and len(task_indices) > 0:
+        loaded_indices = set(range(len(project_packs)))
+
+    # so is PCH reuse, changed project may join, leave or own any PCH group
+    if args.pch and len(task_indices) > 0:
+        for index,project_pack in enumerate(project_packs):
+            if any(map(lambda x : x.pch_header is not None,project_pack)):
+                loaded_indices.add(index)
+
+    if stats is not None:
+        stats.begin("write")
+
+    for index,project_pack in enumerate(project_packs):
+        if index in loaded_indices or not is_project_pack_output_present(project_pack,dest_base_dir,args.shared_common):
+            if stats is not None:
+                stats.begin_project(project_pack[0].project_name,"generate")
+
+            if args.shared_common:
+                generate_shared_cmake_for_project_pack(project_pack,dest_base_dir,context)
+            else:
+                for project in project_pack:
+                    generate_cmake_for_project(project,dest_base_dir,context)
+
+            if stats is not None:
+                stats.end_project()
+
+    root_section = format_compiler_cache_section(remote_root_dir,args.compiler_launcher,args.relative_paths)
+
+    if job_pools is not None:
+        root_section += format_job_pools_section(job_pools)
+
+    cmake_minimum_version = CMAKE_UNITY_PCH_MINIMUM_VERSION if args.unity or args.pch else CMAKE_MINIMUM_VERSION
+
+    generate_cmakelists(project_packs,dest_base_dir,references,context,root_section,cmake_minimum_version)
+    write_imports_index(dest_base_dir,build_imports_index(project_packs,project_keys),output_files)
+
+    if stats is not None:
+        stats.end()
+
+    if output_files.plan is None:
+        Log.logger.info("%d output files are updated, %d are unchanged",output_files.updated,output_files.unchanged)
+
+    if manifest is not None:
+        manifest.save()
+
+    return project_packs
+
+# Arguments fields which may be passed to convert() in options
+CONVERT_OPTIONS = ( "streaming","jobs","single_pass","configurations","platforms","shared_common","unity","pch",
+                    "compiler_launcher","relative_paths","job_pools","shared_objects","fork_prefix" )
+
+class Conversion:
+    # result of convert(): loaded projects and files to be written
+    def __init__(self,project_packs,files):
+        self.project_packs = project_packs # per project lists of CMakeProjectInfo (one per configuration), in solution order
+        self.files         = files         # [(filename,content)] in writing order
+
+    def write(self):
+        # writes files (unchanged files are not touched), returns number of updated files
+        writer = OutputFiles()
+
+        for filename,content in self.files:
+            writer.write(filename,content)
+
+        return writer.updated
+
+def convert(sln_path,root_dir,dest_dir,setup=None,options=None,cache=None):
+    """
+    Converts solution in-process and returns Conversion with evaluated
+    project models and write plan, nothing is written to dest_dir.
+    setup is Setup class (default config if not given), options are
+    Arguments fields (see CONVERT_OPTIONS), e.g. { "shared_common" : True }.
+    Parsed documents are cached between calls while files are unchanged,
+    calls given the same ProjectModelCache share loaded projects (and
+    directory listings, so files are expected not to change meanwhile).
+    Every call has own Setup, writer and warnings, so calls may run
+    concurrently in threads unless they share ProjectModelCache.
+    """
+    args = Arguments()
+
+    args.sln_filename = sln_path
+    args.root_dir     = root_dir
+    args.dest_dir     = dest_dir
+
+    for name,value in (options or {}).items():
+        if name not in CONVERT_OPTIONS:
+            raise RuntimeError("unsupported convert option (%s)" % (name))
+
+        setattr(args,name,value)
+
+    config_filename = SLN2CMAKE_CONFIG_DEFAULT_FILENAME
+
+    if setup is None:
+        setup = sln2cmake_config.Setup
+    else:
+        # user config is loaded again by file name in worker processes (jobs)
+        config_filename = getattr(sys.modules.get(setup.__module__),"__file__",config_filename)
+
+    context = ConversionContext(setup,config_filename,cache)
+    plan    = []
+
+    context.output_files.plan = plan
+
+    # repeated warnings of the call are counted and reported separately
+    warnings = Log.take_repeated_warnings()
+
+    try:
+        project_packs = convert_sln_to_cmakes(args,context,cache=cache)
+    finally:
+        Log.log_repeated_warnings()
+        Log.restore_repeated_warnings(warnings)
+
+    return Conversion(project_packs,plan)
+
+def convert_sln_batch(args,context):
+    # Solutions are converted one by one in this process, so they share parsed
+    # documents, directory listings, import prefix snapshots and loaded projects.
+    # Failed solution is reported and the rest are converted anyway.
+    cache  = ProjectModelCache()
+    failed = 0
+
+    for root_dir,sln_filename,dest_dir in args.solutions:
+        solution_args = copy.copy(args)
+
+        solution_args.root_dir     = root_dir
+        solution_args.sln_filename = sln_filename
+        solution_args.dest_dir     = dest_dir
+
+        Log.logger.info("converting %s to %s",sln_filename,dest_dir)
+
+        try:
+            convert_sln_to_cmakes(solution_args,context,cache=cache)
+        except (RuntimeError,EnvironmentError) as e:
+            Log.logger.error("%s: %s",sln_filename,e)
+            failed += 1
+
+    Log.logger.info("%d of %d solutions are converted",len(args.solutions) - failed,len(args.solutions))
+
+def get_watched_config_filenames():
+    # user config may appear or be removed as well (default config is not
+    # reloaded, it is imported as a module)
+    return list(map(os.path.abspath,SLN2CMAKE_CONFIG_USER_FILENAMES))
+
+def get_watched_filenames(args,project_packs):
+    filenames = [ os.path.abspath(args.sln_filename) ] + get_watched_config_filenames()
+
+    for project_pack in project_packs:
+        for project in project_pack:
+            for filename in project.input_filenames:
+                if filename not in filenames:
+                    filenames.append(filename)
+
+    return filenames
+
+def get_watched_signatures(filenames):
+    signatures = {}
+
+    for filename in filenames:
+        try:
+            signatures[filename] = get_input_signature(filename)
+        except (IOError,OSError):
+            signatures[filename] = [None,None,None] # missing file, any appearance is a change
+
+    return signatures
+
+def is_watched_file_unchanged(filename,signature):
+    if signature[2] is None:
+        return not os.path.exists(filename)
+    else:
+        return is_input_unchanged(filename,signature)
+
+def get_changed_filenames(signatures):
+    return list(filter(lambda x : not is_watched_file_unchanged(x,signatures[x]),sorted(signatures.keys())))
+
+def run_watch_cycle(args,context,manifest):
+    if args.stats is not None:
+        Stats.current = Stats.RunStats(args.stats_allocations)
+
+    try:
+        return convert_sln_to_cmakes(args,context,manifest)
+    finally:
+        if args.stats is not None:
+            write_stats(args.stats,Stats.current)
+
+        Log.log_repeated_warnings()
+
+def watch_sln_to_cmakes(args,context):
+    # Keeps solution, parsed documents, compiled expressions and project
+    # models in memory and regenerates output when some of inputs (solution,
+    # project and imported files, config) is changed. Generation is
+    # incremental, so only projects with changed inputs are walked again.
+
+    dest_base_dir = args.dest_dir if os.path.isabs(args.dest_dir) else os.path.normpath(args.dest_dir)
+    manifest      = None
+    filenames     = get_watched_filenames(args,[])
+
+    while True:
+        incremental_context = get_incremental_context(args.root_dir,args.get_output_options(),context.config_filename)
+
+        if manifest is None or manifest.context != incremental_context:
+            manifest = IncrementalManifest(dest_base_dir,incremental_context)
+            manifest.load()
+
+        try:
+            filenames = get_watched_filenames(args,run_watch_cycle(args,context,manifest))
+        except (RuntimeError,EnvironmentError,SyntaxError) as e:
+            # project may be saved in the middle of editing, keep watching
+            Log.logger.error("%s",e)
+            manifest = None
+        except Exception:
+            Log.logger.exception("conversion failed")
+            manifest = None
+
+        signatures = get_watched_signatures(filenames)
+
+        Log.logger.info("watching %d files for changes (press Ctrl+C to stop)...",len(filenames))
+
+        changed = []
+
+        def is_changed():
+            changed.extend(get_changed_filenames(signatures))
+            return len(changed) > 0
+
+        FileWatcher(filenames).wait(is_changed)
+
+        Log.logger.info("changed %s",", ".join(changed))
+
+        if any(map(lambda x : x in changed,get_watched_config_filenames())):
+            try:
+                setup,config_filename = load_setup()
+            except Exception:
+                # previous (possibly wrapped) Setup stays in use
+                Log.logger.exception("config reload failed")
+            else:
+                context.use_setup(setup,config_filename)
+
+                if args.stats is not None:
+                    context.setup = StatsSetupProxy(context.setup)
+
+def load_batch_file(filename):
+    # batch file is JSON list of { "root_dir" : ..., "sln" : ..., "dest" : ... } objects,
+    # relative paths are relative to current directory (as command line ones)
+    try:
+        with open(filename,"rt") as src:
+            entries = json.load(src)
+    except (IOError,ValueError) as e:
+        raise RuntimeError("can't read batch file %s (%s)" % (filename,e))
+
+    if type(entries) is not list or len(entries) == 0:
+        raise RuntimeError("batch file %s must contain non-empty list of solutions" % (filename))
+
+    solutions = []
+
+    for entry in entries:
+        if type(entry) is not dict or any([ name not in entry for name in ("root_dir","sln","dest") ]):
+            raise RuntimeError("invalid batch file %s entry (%s), root_dir, sln and dest are required" % (filename,entry))
+
+        solutions.append((native_str(entry["root_dir"]),native_str(entry["sln"]),native_str(entry["dest"])))
+
+    return solutions
+
+class Arguments:
+    def __init__(self):
+        self.sln_filename = None
+        self.dest_dir     = None
+        self.root_dir     = None
+        self.streaming    = False
+        self.jobs         = 1
+        self.incremental  = False
+        self.single_pass  = False
+        self.stats        = None
+        self.stats_allocations = False
+        self.configurations = None
+        self.platforms      = None
+        self.shared_common  = False
+        self.unity          = False
+        self.pch            = False
+        self.compiler_launcher = None
+        self.relative_paths    = False
+        self.job_pools         = False
+        self.shared_objects    = False
+        self.watch             = False
+        self.affected          = None
+        self.fork_prefix       = False
+        self.verbosity         = 0
+        self.batch             = None
+        self.solutions         = [] # (root dir,.sln file name,dest dir)
+
+    def get_output_options(self):
+        # options affecting content of generated files
+        return { "shared_common"     : self.shared_common,
+                 "unity"             : self.unity,
+                 "pch"               : self.pch,
+                 "compiler_launcher" : self.compiler_launcher,
+                 "relative_paths"    : self.relative_paths,
+                 "job_pools"         : self.job_pools,
+                 "shared_objects"    : self.shared_objects }
+
+    def parse_command_line(self,args):
+        positional = []
+        args       = list(args)
+
+        while len(args) > 0:
+            arg = args.pop(0)
+
+            if arg == "--streaming":
+                self.streaming = True
+            elif arg == "--incremental":
+                self.incremental = True
+            elif arg == "--single-pass":
+                self.single_pass = True
+            elif arg == "--shared-common":
+                self.shared_common = True
+            elif arg == "--unity":
+                self.unity = True
+            elif arg == "--pch":
+                self.pch = True
+            elif arg == "--relative-paths":
+                self.relative_paths = True
+            elif arg == "--job-pools":
+                self.job_pools = True
+            elif arg == "--shared-objects":
+                self.shared_objects = True
+            elif arg == "--fork-prefix":
+                self.fork_prefix = True
+            elif arg == "-q" or arg == "--quiet":
+                self.verbosity = -1
+            elif arg == "-v" or arg == "--verbose":
+                self.verbosity = max(self.verbosity,0) + 1
+            elif arg == "-vv":
+                self.verbosity = 2
+            elif arg == "--affected":
+                if len(args) == 0:
+                    raise RuntimeError("--affected option requires file name")
+
+                self.affected = args.pop(0)
+            elif arg == "--watch":
+                self.watch       = True
+                self.incremental = True
+            elif arg == "--compiler-launcher":
+                if len(args) == 0:
+                    raise RuntimeError("--compiler-launcher option requires program name")
+
+                self.compiler_launcher = args.pop(0)
+            elif arg == "--batch":
+                if len(args) == 0:
+                    raise RuntimeError("--batch option requires file name")
+
+                self.batch = args.pop(0)
+            elif arg == "--stats":
+                if len(args) == 0:
+                    raise RuntimeError("--stats option requires file name")
+
+                self.stats = args.pop(0)
+            elif arg == "--stats-allocations":
+                if not Stats.is_allocation_tracing_supported():
+                    raise RuntimeError("--stats-allocations option requires python 3.9 or newer")
+
+                self.stats_allocations = True
+            elif arg == "--configurations":
+                self.configurations = self.__parse_list_option(arg,args,CONFIGURATION_LIST)
+            elif arg == "--platforms":
+                self.platforms = self.__parse_list_option(arg,args,PLATFORM_LIST)
+            elif arg == "--jobs":
+                if len(args) == 0:
+                    raise RuntimeError("--jobs option requires number of processes")
+
+                try:
+                    self.jobs = int(args.pop(0))
+                except ValueError:
+                    raise RuntimeError("invalid --jobs value")
+
+                if self.jobs < 1:
+                    raise RuntimeError("invalid --jobs value")
+            elif arg.startswith("--"):
+                raise RuntimeError("unknown option (%s)" % (arg))
+            else:
+                positional.append(arg)
+
+        if self.batch is not None:
+            if len(positional) > 0:
+                raise RuntimeError("--batch can't be combined with root dir, .sln file name and dest dir parameters")
+
+            self.solutions = load_batch_file(self.batch)
+        elif len(positional) < 3 or len(positional) % 2 == 0:
+            raise RuntimeError("root dir, .sln file name and dest dir parameters required")
+        else:
+            self.solutions = [ (positional[0],positional[index],positional[index + 1]) for index in range(1,len(positional),2) ]
+
+        if len(self.solutions) > 1 and (self.watch or self.affected is not None):
+            raise RuntimeError("--watch and --affected support single solution only")
+
+        if self.stats_allocations and self.stats is None:
+            raise RuntimeError("--stats-allocations option requires --stats")
+
+        if self.fork_prefix and (self.streaming or self.single_pass):
+            raise RuntimeError("--fork-prefix can't be combined with --streaming or --single-pass")
+
+        self.root_dir,self.sln_filename,self.dest_dir = self.solutions[0]
+
+    def __parse_list_option(self,option,args,supported):
+        if len(args) == 0:
+            raise RuntimeError("%s option requires comma separated list" % (option))
+
+        values = split_string_normalized(args.pop(0),",")
+
+        for value in values:
+            if value not in supported:
+                raise RuntimeError("unsupported %s value (%s), supported are %s" % (option,value,",".join(supported)))
+
+        if len(values) == 0:
+            raise RuntimeError("empty %s list" % (option))
+
+        return values
+
+class StatsSetupProxy:
+    # accounts time spent in Setup hooks to setup_hooks statistics phase
+
+    def __init__(self,setup):
+        self.setup = setup
+
+    def __getattr__(self,name):
+        hook = getattr(self.setup,name)
+
+        if not callable(hook):
+            return hook
+
+        def stats_hook(*args):
+            stats = Stats.current
+
+            if stats is None:
+                return hook(*args)
+
+            stats.begin("setup_hooks")
+
+            try:
+                return hook(*args)
+            finally:
+                stats.end()
+
+        return stats_hook
+
+def write_stats(filename,stats):
+    with open(filename,"wt") as dest:
+        json.dump(stats.to_dict(),dest,indent=2,sort_keys=True)
+
+def main():
+    args = Arguments()
+    args.parse_command_line(sys.argv[1:])
+
+    Log.setup(args.verbosity)
+
+    try:
+        context = ConversionContext(*load_setup())
+    except RuntimeError as e:
+        Log.logger.error("%s",e)
+        return
+
+    if args.stats is not None:
+        Stats.current = Stats.RunStats(args.stats_allocations)
+        context.setup = StatsSetupProxy(context.setup)
+
+    if args.affected is not None:
+        try:
+            for project_name,configuration,platform in get_affected_projects(args.dest_dir,args.affected):
+                print("%s %s|%s" % (project_name,configuration,platform))
+        except RuntimeError as e:
+            Log.logger.error("%s",e)
+        return
+
+    if args.watch:
+        try:
+            watch_sln_to_cmakes(args,context)
+        except KeyboardInterrupt:
+            Log.logger.info("watching is stopped")
+        return
+
+    try:
+        if len(args.solutions) > 1:
+            convert_sln_batch(args,context)
+        else:
+            convert_sln_to_cmakes(args,context)
+    except RuntimeError as e:
+        Log.logger.error("%s",e)
+
+    Log.log_repeated_warnings()
+
+    if args.stats is not None:
+        write_stats(args.stats,Stats.current)
 
-main()
+if __name__ == "__main__":
+    main()
 
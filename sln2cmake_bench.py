@@ -0,0 +1,348 @@
+#!/usr/bin/python
+
+"""
+Benchmark for sln2cmake.
+Generates synthetic solution of requested size, then times solution loading,
+project walking, project evaluation and cmake files generation separately.
+Results are written as JSON to be compared between versions.
+"""
+
+import sys
+import os
+import os.path
+import time
+import json
+import shutil
+import tempfile
+import argparse
+
+import sln2cmake
+import sln2cmake_config
+
+from mssln.Solution import Solution
+from mssln.ProjectWalker import ProjectWalker,ProjectVisitor,clear_document_cache
+from mssln.StreamingProjectWalker import StreamingProjectWalker
+from mssln.Evaluator import clear_expression_cache
+import mssln.Stats as Stats
+from mssln.Stats import get_process_peak_rss_kb,start_allocation_tracing,take_allocation_peak_kb
+
+MSBUILD_NS = "http://schemas.microsoft.com/developer/msbuild/2003"
+
+def write_text(filename,text):
+    with open(filename,"wt") as dest:
+        dest.write(text)
+
+def format_condition(configuration,platform):
+    return "'$(Configuration)|$(Platform)'=='%s|%s'" % (configuration,platform)
+
+def generate_props_chain(props_dir,depth):
+    for index in range(depth):
+        if index + 1 < depth:
+            inner = '  <Import Project="chain%d.props" />\n' % (index + 1)
+        else:
+            inner = ''
+
+        write_text(os.path.join(props_dir,"chain%d.props" % (index)),
+                   '<?xml version="1.0" encoding="utf-8"?>\n'
+                   '<Project xmlns="%s">\n'
+                   '%s'
+                   '  <PropertyGroup>\n'
+                   '    <IncludePath>$(IncludePath);$(RemoteRootDir)/include/chain%d</IncludePath>\n'
+                   '    <ChainLevel%d>$(MSBuildThisFileName)</ChainLevel%d>\n'
+                   '  </PropertyGroup>\n'
+                   '  <ItemDefinitionGroup>\n'
+                   '    <ClCompile><PreprocessorDefinitions>%%(PreprocessorDefinitions);CHAIN%d</PreprocessorDefinitions></ClCompile>\n'
+                   '  </ItemDefinitionGroup>\n'
+                   '</Project>\n' % (MSBUILD_NS,inner,index,index,index,index))
+
+def generate_wildcard_props(wildcard_dir,count):
+    for index in range(count):
+        write_text(os.path.join(wildcard_dir,"wild%d.props" % (index)),
+                   '<?xml version="1.0" encoding="utf-8"?>\n'
+                   '<Project xmlns="%s">\n'
+                   '  <PropertyGroup><Wild%d>$(Platform)</Wild%d></PropertyGroup>\n'
+                   '</Project>\n' % (MSBUILD_NS,index,index))
+
+def generate_project(filename,index,params):
+    configuration_types = ("StaticLibrary","DynamicLibrary","Application")
+
+    lines = []
+
+    lines.append('<?xml version="1.0" encoding="utf-8"?>')
+    lines.append('<Project DefaultTargets="Build" ToolsVersion="15.0" xmlns="%s">' % (MSBUILD_NS))
+    lines.append('  <ItemGroup Label="ProjectConfigurations">')
+
+    for configuration in sln2cmake.CONFIGURATION_LIST:
+        for platform in sln2cmake.PLATFORM_LIST:
+            lines.append('    <ProjectConfiguration Include="%s|%s"><Configuration>%s</Configuration><Platform>%s</Platform></ProjectConfiguration>' %
+                         (configuration,platform,configuration,platform))
+
+    lines.append('  </ItemGroup>')
+
+    if params.import_depth > 0:
+        lines.append('  <ImportGroup Label="PropertySheets">')
+        lines.append('    <Import Project="../props/chain0.props" />')
+        lines.append('  </ImportGroup>')
+
+    if params.wildcard_imports > 0:
+        lines.append('  <Import Project="../props/wild/*.props" />')
+
+    lines.append('  <Import Project="$(VCTargetsPath)\\Microsoft.Cpp.Default.props" />')
+    lines.append('  <PropertyGroup>')
+    lines.append('    <ConfigurationType>%s</ConfigurationType>' % (configuration_types[index % len(configuration_types)]))
+    lines.append('  </PropertyGroup>')
+
+    for group_index in range(params.conditional_groups):
+        configuration = sln2cmake.CONFIGURATION_LIST[group_index % len(sln2cmake.CONFIGURATION_LIST)]
+        platform      = sln2cmake.PLATFORM_LIST[(group_index // len(sln2cmake.CONFIGURATION_LIST)) % len(sln2cmake.PLATFORM_LIST)]
+        condition     = format_condition(configuration,platform)
+
+        lines.append('  <PropertyGroup Condition="%s">' % (condition))
+        lines.append('    <IncludePath>$(IncludePath);$(RemoteRootDir)/include/cond%d</IncludePath>' % (group_index))
+        lines.append('  </PropertyGroup>')
+        lines.append('  <ItemDefinitionGroup Condition="%s">' % (condition))
+        lines.append('    <ClCompile><PreprocessorDefinitions>%%(PreprocessorDefinitions);COND%d</PreprocessorDefinitions></ClCompile>' % (group_index))
+        lines.append('    <Link><LibraryDependencies>%%(LibraryDependencies);cond%d</LibraryDependencies></Link>' % (group_index))
+        lines.append('  </ItemDefinitionGroup>')
+
+    lines.append('  <ItemGroup>')
+
+    for item_index in range(params.items):
+        if params.options_every > 0 and item_index % params.options_every == 0:
+            lines.append('    <ClCompile Include="src/file%d.cpp">' % (item_index))
+            lines.append('      <AdditionalOptions Condition="%s">-DITEM%d</AdditionalOptions>' % (format_condition("Debug","x64"),item_index))
+            lines.append('    </ClCompile>')
+        else:
+            lines.append('    <ClCompile Include="src/file%d.cpp" />' % (item_index))
+
+    lines.append('  </ItemGroup>')
+    lines.append('  <Import Project="$(VCTargetsPath)\\Microsoft.Cpp.targets" />')
+    lines.append('</Project>')
+
+    write_text(filename,"\n".join(lines) + "\n")
+
+def generate_solution(base_dir,params):
+    props_dir    = os.path.join(base_dir,"props")
+    wildcard_dir = os.path.join(props_dir,"wild")
+
+    os.makedirs(wildcard_dir)
+
+    generate_props_chain(props_dir,params.import_depth)
+    generate_wildcard_props(wildcard_dir,params.wildcard_imports)
+
+    lines = [ "Microsoft Visual Studio Solution File, Format Version 12.00",
+              "# Visual Studio 15",
+              "VisualStudioVersion = 15.0.27130.2027",
+              "MinimumVisualStudioVersion = 10.0.40219.1" ]
+
+    for index in range(params.projects):
+        name = "bench%d" % (index)
+
+        os.makedirs(os.path.join(base_dir,name))
+
+        generate_project(os.path.join(base_dir,name,name + ".vcxproj"),index,params)
+
+        lines.append('Project("{8BC9CEB8-8B4A-11D0-8D11-00A0C91E6BC2}") = "%s", "%s\\%s.vcxproj", "{%08X-0000-0000-0000-000000000000}"' % (name,name,name,index))
+        lines.append('EndProject')
+
+    # solution parser expects Global section after projects
+    lines.append('Global')
+    lines.append('EndGlobal')
+
+    sln_filename = os.path.join(base_dir,"bench.sln")
+
+    write_text(sln_filename,"\n".join(lines) + "\n")
+
+    return sln_filename
+
+def get_solution_projects(solution,sln_filename):
+    return [ (project.name,os.path.normpath(os.path.join(os.path.dirname(sln_filename),sln2cmake.path_normalize_slashes(project.filename))))
+             for project in solution.projects ]
+
+def clear_caches():
+    clear_document_cache()
+    clear_expression_cache()
+
+class Phase:
+    # allocation peak is reported only if allocations are traced (--trace-allocations)
+    trace_allocations = False
+
+    def __init__(self,name):
+        self.name               = name
+        self.allocation_peak_kb = None
+
+    def __enter__(self):
+        if self.trace_allocations:
+            take_allocation_peak_kb()
+
+        self.wall = time.time()
+        self.cpu  = time.clock() if hasattr(time,"clock") else time.process_time()
+        return self
+
+    def __exit__(self,exc_type,exc_value,tb):
+        cpu = time.clock() if hasattr(time,"clock") else time.process_time()
+
+        self.wall                = time.time() - self.wall
+        self.cpu                 = cpu - self.cpu
+        self.process_peak_rss_kb = get_process_peak_rss_kb()
+
+        if self.trace_allocations:
+            self.allocation_peak_kb = take_allocation_peak_kb()
+
+    def to_dict(self,units=None,units_name=None):
+        result = { "wall_seconds"        : self.wall,
+                   "cpu_seconds"         : self.cpu,
+                   "process_peak_rss_kb" : self.process_peak_rss_kb,
+                   "allocation_peak_kb"  : self.allocation_peak_kb }
+
+        if units is not None and self.wall > 0:
+            result[units_name + "_per_second"] = units / self.wall
+
+        return result
+
+def walk_projects(projects,walker_class):
+    for configuration in sln2cmake.CONFIGURATION_LIST:
+        for platform in sln2cmake.PLATFORM_LIST:
+            for project_name,project_filename in projects:
+                walker_class(project_name,project_filename).walk(ProjectVisitor())
+
+def run_benchmark(base_dir,params):
+    sln_filename = generate_solution(base_dir,params)
+
+    results = {}
+
+    with Phase("solution_load") as phase:
+        for index in range(params.repeat):
+            solution = Solution(sln_filename)
+
+    results[phase.name] = phase.to_dict(params.projects * params.repeat,"projects")
+
+    projects = get_solution_projects(solution,sln_filename)
+    walks    = len(projects) * len(sln2cmake.CONFIGURATION_LIST) * len(sln2cmake.PLATFORM_LIST)
+    matrix   = sln2cmake.get_configuration_matrix(sln2cmake.CONFIGURATION_LIST,sln2cmake.PLATFORM_LIST)
+    context  = sln2cmake.ConversionContext(sln2cmake_config.Setup,sln2cmake.SLN2CMAKE_CONFIG_DEFAULT_FILENAME)
+
+    # pure walk with no-op visitor: XML parsing and tree traversal only
+    for phase_name,walker_class in (("walk",ProjectWalker),("walk_streaming",StreamingProjectWalker)):
+        clear_caches()
+
+        with Phase(phase_name) as phase:
+            walk_projects(projects,walker_class)
+
+        results[phase.name] = phase.to_dict(walks,"project_walks")
+
+    # full load: walk plus expressions evaluation and import resolution
+    load_variants = (("load",ProjectWalker,False),
+                     ("load_streaming",StreamingProjectWalker,False),
+                     ("load_single_pass",ProjectWalker,True))
+
+    for phase_name,walker_class,single_pass in load_variants:
+        clear_caches()
+
+        with Phase(phase_name) as phase:
+            project_packs = [ sln2cmake.load_project_pack((walker_class,project_name,project_filename,params.root_dir,single_pass,matrix),context)
+                              for project_name,project_filename in projects ]
+
+        results[phase.name] = phase.to_dict(walks,"project_walks")
+
+    # evaluation is interleaved with walk, so it is timed by evaluate phase of
+    # run statistics (time of innermost phase) during one more load
+    clear_caches()
+
+    Stats.current = Stats.RunStats(Phase.trace_allocations)
+
+    try:
+        for project_name,project_filename in projects:
+            sln2cmake.load_project_pack((ProjectWalker,project_name,project_filename,params.root_dir,False,matrix),context)
+
+        evaluate = Stats.current.to_dict()
+    finally:
+        Stats.current = None
+
+    evaluations = evaluate["counters"].get("expressions_evaluated",0)
+    phase       = evaluate["phases"]["evaluate"]
+
+    results["evaluate"] = { "wall_seconds"       : phase["wall_seconds"],
+                            "cpu_seconds"        : phase["cpu_seconds"],
+                            "allocation_peak_kb" : phase["allocation_peak_kb"],
+                            "expressions"        : evaluations }
+
+    if phase["wall_seconds"] > 0:
+        results["evaluate"]["expressions_per_second"] = evaluations / phase["wall_seconds"]
+
+    dest_dir = os.path.join(base_dir,"out")
+
+    # solution path is relative, output layout follows project paths as loaded (see get_layout_project_filename())
+    for project_pack,(project_name,project_filename) in zip(project_packs,projects):
+        for project in project_pack:
+            project.solution_project_filename = project_filename
+
+    with Phase("generate") as phase:
+        for project_pack in project_packs:
+            for project in project_pack:
+                sln2cmake.generate_cmake_for_project(project,dest_dir,context)
+
+    results[phase.name] = phase.to_dict(walks,"cmake_files")
+
+    return results
+
+def parse_command_line(args):
+    parser = argparse.ArgumentParser(description="sln2cmake benchmark on synthetic solution")
+
+    parser.add_argument("--projects",type=int,default=20,help="number of projects in solution")
+    parser.add_argument("--items",type=int,default=200,help="ClCompile items per project")
+    parser.add_argument("--import-depth",type=int,default=3,help="depth of imported property sheets chain")
+    parser.add_argument("--wildcard-imports",type=int,default=2,help="number of files matched by wildcard import")
+    parser.add_argument("--conditional-groups",type=int,default=4,help="conditional PropertyGroup/ItemDefinitionGroup pairs per project")
+    parser.add_argument("--options-every",type=int,default=10,help="every N-th ClCompile item has conditional AdditionalOptions (0 - none)")
+    parser.add_argument("--repeat",type=int,default=10,help="solution load repetitions")
+    parser.add_argument("--root-dir",default="/remote/root",help="RemoteRootDir value")
+    parser.add_argument("--work-dir",default=None,help="directory for generated files (temporary one is used and removed by default)")
+    parser.add_argument("--output",default=None,help="JSON results file (stdout by default)")
+    parser.add_argument("--trace-allocations",action="store_true",help="report peak of python allocations per phase (python 3.9+, slow)")
+
+    return parser.parse_args(args)
+
+def main():
+    params = parse_command_line(sys.argv[1:])
+
+    if params.trace_allocations:
+        start_allocation_tracing()
+        Phase.trace_allocations = True
+
+    if params.work_dir is not None:
+        base_dir = params.work_dir
+        os.makedirs(base_dir)
+    else:
+        base_dir = tempfile.mkdtemp(prefix="sln2cmake_bench_")
+
+    cwd = os.getcwd()
+
+    try:
+        os.chdir(base_dir)
+        results = run_benchmark(".",params)
+    finally:
+        os.chdir(cwd)
+
+        if params.work_dir is None:
+            shutil.rmtree(base_dir)
+
+    report = { "version"    : sln2cmake.__version__,
+               "python"     : sys.version.split()[0],
+               "parameters" : { "projects"           : params.projects,
+                                "items"              : params.items,
+                                "import_depth"       : params.import_depth,
+                                "wildcard_imports"   : params.wildcard_imports,
+                                "conditional_groups" : params.conditional_groups,
+                                "options_every"      : params.options_every },
+               "results"    : results }
+
+    if params.output is not None:
+        with open(params.output,"wt") as dest:
+            json.dump(report,dest,indent=2,sort_keys=True)
+    else:
+        json.dump(report,sys.stdout,indent=2,sort_keys=True)
+        sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
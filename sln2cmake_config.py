@@ -14,6 +14,8 @@ class Setup:
     # The pipeline: [project_serach] -> [loader] -> [project] -> [cmake_generate]
     # During [loader] operation, before [project] is filled, 
     # You may store data in loader.user_load_data field (then copied to project.user_load_data by loader)
+    # When run with --jobs N, [loader] events are called in worker processes,
+    # so data stored in user_load_data should be picklable
 
     # --- [project search] customization ---
 
@@ -72,6 +74,41 @@ class Setup:
     def cmake_root_get_after_head_section():
         return SETUP_AFTER_HEAD_SECTION # default = empty string
 
+    # public
+    # unity build (--unity): number of sources combined into one unity source
+    # returns 0 to disable unity build for the project
+    @staticmethod
+    def cmake_get_unity_build_batch_size(project):
+        return 8 # default is the same as cmake default
+
+    # public
+    # unity build (--unity): returns True if compile item (source) should not be combined with others
+    # (sources with own compile options are never combined)
+    @staticmethod
+    def is_unity_build_excluded(project, compile_item):
+        return False # default is nothing to exclude
+
+    # public
+    # ninja job pools (--job-pools): list of (pool name, max number of concurrent jobs)
+    @staticmethod
+    def cmake_get_job_pools():
+        return [ ("link", 8), ("link_heavy", 2) ] # default limits link concurrency only
+
+    # public
+    # ninja job pools (--job-pools): returns (compile pool name, link pool name) for the project
+    # (None - project jobs are not limited by pool)
+    @staticmethod
+    def cmake_get_project_job_pools(project):
+        if project.configuration_type == "StaticLibrary":
+            return (None, None) # archiving is cheap
+
+        weight = len(project.compile_items) + 10 * len(project.library_dependencies)
+
+        if weight >= 500:
+            return (None, "link_heavy")
+        else:
+            return (None, "link")
+
     # public [event]
     # before output to cmake file is done
     @staticmethod
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+
+"""
+Golden output tests: loading modes (default, --single-pass, --streaming,
+--fork-prefix, --jobs N) and convert() API must produce byte-identical
+output, second --incremental run must not update anything.
+Run with: python -m unittest discover -s tests
+"""
+
+import sys
+import os
+import os.path
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0,ROOT_DIR)
+
+import sln2cmake
+import sln2cmake_bench
+
+SCRIPT_FILENAME = os.path.join(ROOT_DIR,"sln2cmake.py")
+REMOTE_ROOT_DIR = "/remote/root"
+
+def read_tree(base_dir):
+    # relative file name -> content
+    files = {}
+
+    for dirpath,dirnames,filenames in os.walk(base_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath,filename)
+
+            with open(path,"rb") as src:
+                files[os.path.relpath(path,base_dir)] = src.read()
+
+    return files
+
+def read_generated_tree(base_dir):
+    files = read_tree(base_dir)
+
+    for filename in (sln2cmake.MANIFEST_FILENAME,sln2cmake.MODELS_FILENAME):
+        files.pop(filename,None)
+
+    return files
+
+class OutputEquivalenceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp(prefix="sln2cmake_test_")
+
+        # shared import chain and wildcard imports, per configuration groups and
+        # per item options exercise prefix forking and single pass lanes
+        params = sln2cmake_bench.parse_command_line([ "--projects","6","--items","30","--options-every","4" ])
+
+        sln2cmake_bench.generate_solution(cls.work_dir,params)
+
+        cls.golden = cls.convert("golden")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir)
+
+    @classmethod
+    def run_tool(cls,dest_name,*options):
+        args    = [ sys.executable,SCRIPT_FILENAME ] + list(options) + [ REMOTE_ROOT_DIR,"bench.sln",dest_name ]
+        process = subprocess.Popen(args,cwd=cls.work_dir,stdout=subprocess.PIPE,stderr=subprocess.STDOUT)
+        output  = process.communicate()[0].decode("utf-8")
+
+        if process.returncode != 0:
+            raise AssertionError("%s failed:\n%s" % (" ".join(args),output))
+
+        return output
+
+    @classmethod
+    def convert(cls,dest_name,*options):
+        cls.run_tool(dest_name,*options)
+
+        return read_tree(os.path.join(cls.work_dir,dest_name))
+
+    def assert_same_as_golden(self,files):
+        self.assertEqual(sorted(files.keys()),sorted(self.golden.keys()))
+
+        for filename,content in files.items():
+            self.assertEqual(content,self.golden[filename],"%s differs" % (filename))
+
+    def test_golden_output_is_not_empty(self):
+        self.assertIn("CMakeLists.txt",self.golden)
+        self.assertIn(os.path.join("bench5","bench5-x64-Release.cmake"),self.golden)
+
+    def test_single_pass(self):
+        self.assert_same_as_golden(self.convert("single_pass","--single-pass"))
+
+    def test_streaming(self):
+        self.assert_same_as_golden(self.convert("streaming","--streaming"))
+
+    def test_fork_prefix(self):
+        self.assert_same_as_golden(self.convert("fork_prefix","--fork-prefix"))
+
+    def test_jobs(self):
+        self.assert_same_as_golden(self.convert("jobs","--jobs","3"))
+
+    def test_single_pass_jobs(self):
+        self.assert_same_as_golden(self.convert("single_pass_jobs","--single-pass","--jobs","2"))
+
+    def test_convert_api(self):
+        cwd = os.getcwd()
+
+        try:
+            os.chdir(self.work_dir)
+            conversion = sln2cmake.convert("bench.sln",REMOTE_ROOT_DIR,"api")
+        finally:
+            os.chdir(cwd)
+
+        files = dict([ (os.path.relpath(filename,"api"),content.encode("utf-8")) for filename,content in conversion.files ])
+
+        self.assert_same_as_golden(files)
+
+    def test_incremental_noop(self):
+        dest_dir = os.path.join(self.work_dir,"incremental")
+
+        self.run_tool("incremental","--incremental")
+
+        # manifest and models are state of the tool, they are saved by every run
+        files  = read_generated_tree(dest_dir)
+        mtimes = dict([ (filename,os.stat(os.path.join(dest_dir,filename)).st_mtime) for filename in files ])
+        output = self.run_tool("incremental","--incremental")
+
+        self.assertIn("6 of 6 projects are up to date",output)
+        self.assertIn("0 output files are updated",output)
+        self.assertEqual(read_generated_tree(dest_dir),files)
+
+        # generated files are not touched, so build does not re-run cmake
+        for filename,mtime in mtimes.items():
+            self.assertEqual(os.stat(os.path.join(dest_dir,filename)).st_mtime,mtime,"%s is rewritten" % (filename))
+
+if __name__ == "__main__":
+    unittest.main()